@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-19 19:34
+
+from django.db import migrations, models
+
+
+def fill_order_summary(apps, schema_editor):
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    Order = apps.get_model('orders', 'Order')
+    totals = Order.objects.filter(is_ordered=True).values('user_id').annotate(
+        count=models.Count('id'), spend=models.Sum('order_total'),
+        last_id=models.Max('id')).order_by()
+    for row in totals:
+        last = Order.objects.get(id=row['last_id'])
+        UserProfile.objects.filter(user_id=row['user_id']).update(
+            order_count=row['count'], lifetime_spend=row['spend'],
+            last_order_number=last.order_number,
+            last_order_at=last.created_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_userprofile'),
+        ('orders', '0006_order_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_order_number',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='lifetime_spend',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_order_summary, migrations.RunPython.noop),
+    ]
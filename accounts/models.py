@@ -77,6 +77,11 @@ class UserProfile(models.Model):
     city = models.CharField(blank=True, max_length=20)
     state = models.CharField(blank=True, max_length=20)
     country = models.CharField(blank=True, max_length=20)
+    # Order summary for the dashboard, kept up to date by orders.rollups
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_spend = models.FloatField(default=0)
+    last_order_number = models.CharField(blank=True, max_length=20)
+    last_order_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
         return self.user.first_name
@@ -12,6 +12,13 @@ from django.utils.http import urlsafe_base64_encode
 from django.core import mail
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
+from category.models import Category
+from orders.models import Order
+from store.models import Product
+import json
 
 # Create your tests here.
 
@@ -349,3 +356,68 @@ class DashboardViewTest(TestCase):
             messages = list(response.context['messages'])
             self.assertEqual(len(messages), 1)
             self.assertEqual(str(messages[0]), 'Account does not exist!')
+
+
+class OrderHistoryTest(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='john@example.com', password='password')
+        self.user.is_active = True
+        self.user.save()
+        UserProfile.objects.create(user=self.user)
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=100, category=category, images='photos/products/test.jpg')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def checkout(self, quantity):
+        for i in range(quantity):
+            self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.client.post(reverse('place_order'), {
+            'first_name': 'John', 'last_name': 'Doe', 'phone': '123',
+            'email': 'john@example.com', 'address_line_1': '1 Street',
+            'address_line_2': '', 'country': 'UA', 'state': 'Kyiv',
+            'city': 'Kyiv', 'order_note': ''})
+        order = Order.objects.get(is_ordered=False)
+        self.client.post(reverse('payments'), json.dumps({
+            'orderID': order.order_number, 'transID': 'T%d' % order.id,
+            'payment_method': 'PayPal', 'status': 'COMPLETED',
+        }), content_type='application/json')
+        return order
+
+    def test_payment_updates_the_summary(self):
+        self.checkout(2)
+        last = self.checkout(1)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.order_count, 2)
+        self.assertEqual(profile.lifetime_spend, 153.0)
+        self.assertEqual(profile.last_order_number, last.order_number)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['orders_count'], 2)
+        self.assertContains(response, last.order_number)
+
+    @patch('accounts.views.MY_ORDERS_PAGE_SIZE', 2)
+    def test_my_orders_keyset_pages(self):
+        orders = [self.checkout(i + 1) for i in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('my_orders'))
+        order_queries = [query for query in queries
+                         if 'FROM "orders_order"' in query['sql']]
+        self.assertEqual(len(order_queries), 1)
+        page = response.context['orders']
+        self.assertEqual([order.id for order in page],
+                         [orders[2].id, orders[1].id])
+        self.assertEqual([order.item_count for order in page], [3, 2])
+        self.assertEqual(page[0].first_image, 'photos/products/test.jpg')
+        self.assertEqual(response.context['older'], orders[1].id)
+
+        response = self.client.get(
+            reverse('my_orders') + '?before=%d' % orders[1].id)
+        self.assertEqual([order.id for order in response.context['orders']],
+                         [orders[0].id])
+        self.assertIsNone(response.context['older'])
+        self.assertContains(response, 'Newest orders')
@@ -2,6 +2,9 @@ from django.shortcuts import render, redirect, get_object_or_404
 from .forms import RegistrationForm, UserForm, UserProfileForm
 from .models import Account, UserProfile
 from orders.models import Order, OrderProduct
+from orders import receipts
+from django.http import Http404
+from django.db.models import OuterRef, Subquery, Sum
 from django.contrib import messages, auth
 from django.contrib.auth.decorators import login_required
 
@@ -19,6 +22,8 @@ from carts.views import _cart_id
 from carts.models import Cart, CartItem
 import requests
 
+MY_ORDERS_PAGE_SIZE = 20
+
 
 def register(request):
     if request.method == 'POST':
@@ -157,13 +162,10 @@ def activate(request, uidb64, token):
 
 @login_required(login_url='login')
 def dashboard(request):
-    orders = Order.objects.order_by(
-        '-created_at').filter(user_id=request.user.id, is_ordered=True)
-    orders_count = orders.count()
-
+    # The order count comes from the summary kept on the profile
     userprofile = UserProfile.objects.get(user_id=request.user.id)
     context = {
-        'orders_count': orders_count,
+        'orders_count': userprofile.order_count,
         'userprofile': userprofile,
     }
     return render(request, 'accounts/dashboard.html', context)
@@ -234,10 +236,26 @@ def resetPassword(request):
 
 @login_required(login_url='login')
 def my_orders(request):
+    # Keyset pages: ?before=<id> lists the orders older than that one
     orders = Order.objects.filter(
-        user=request.user, is_ordered=True).order_by('-created_at')
+        user=request.user, is_ordered=True).order_by('-id')
+    before = request.GET.get('before', '')
+    if before.isdigit():
+        orders = orders.filter(id__lt=int(before))
+    first_image = OrderProduct.objects.filter(
+        order=OuterRef('pk')).order_by('id').values('product__images')[:1]
+    orders = list(orders.annotate(
+        item_count=Sum('orderproduct__quantity'),
+        first_image=Subquery(first_image),
+    )[:MY_ORDERS_PAGE_SIZE + 1])
+    older = None
+    if len(orders) > MY_ORDERS_PAGE_SIZE:
+        orders = orders[:MY_ORDERS_PAGE_SIZE]
+        older = orders[-1].id
     context = {
         'orders': orders,
+        'older': older,
+        'is_first_page': not before.isdigit(),
     }
     return render(request, 'accounts/my_orders.html', context)
 
@@ -251,7 +269,9 @@ def edit_profile(request):
             request.POST, request.FILES, instance=userprofile)
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
-            profile_form.save()
+            # Leave the order summary to orders.rollups
+            profile_form.save(commit=False).save(
+                update_fields=UserProfileForm.Meta.fields)
             messages.success(request, 'Your profile has been updated.')
             return redirect('edit_profile')
     else:
@@ -293,15 +313,14 @@ def change_password(request):
 
 @login_required(login_url='login')
 def order_detail(request, order_id):
-    order_detail = OrderProduct.objects.filter(order__order_number=order_id)
-    order = Order.objects.get(order_number=order_id)
-    subtotal = 0
-    for i in order_detail:
-        subtotal += i.product_price * i.quantity
+    receipt = receipts.for_user(order_id, request.user)
+    if receipt is None:
+        raise Http404
 
     context = {
-        'order_detail': order_detail,
-        'order': order,
-        'subtotal': subtotal,
+        'order_detail': receipt['lines'],
+        'order': receipt['order'],
+        'payment': receipt['payment'],
+        'subtotal': receipt['subtotal'],
     }
     return render(request, 'accounts/order_detail.html', context)
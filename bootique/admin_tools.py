@@ -0,0 +1,90 @@
+from django.contrib import admin
+from django.contrib.admin.views.main import ERROR_FLAG, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.utils.functional import cached_property
+
+# Admin helpers for the big tables. Unfiltered change lists take their row
+# count from the database's table statistics rather than COUNT(*), and
+# foreign keys are filtered through a text box rather than a list of
+# every related row.
+
+
+def estimated_count(model):
+    """The planner's row estimate for model's table, or None."""
+    using = router.db_for_read(model)
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'mysql':
+        sql = ('SELECT table_rows FROM information_schema.tables '
+               'WHERE table_schema = DATABASE() AND table_name = %s')
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    # Below this many rows an exact count is cheap enough
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list.model)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # The "N total" link would run the exact COUNT(*) anyway
+    show_full_result_count = False
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Filter on a foreign key by id or by a name prefix typed in a box.
+
+    Subclasses set title, parameter_name, the id field in ``lookup`` and
+    the name field searched by prefix in ``prefix_lookup``.
+    """
+    template = 'admin/input_filter.html'
+    lookup = None
+    prefix_lookup = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'hidden': [
+                (key, value) for key, value in changelist.params.items()
+                if key not in (self.parameter_name, PAGE_VAR, ERROR_FLAG)],
+        }
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        if value.isdigit():
+            return queryset.filter(**{self.lookup: value})
+        return queryset.filter(**{self.prefix_lookup + '__istartswith': value})
+
+
+class ProductFilter(InputFilter):
+    title = 'product'
+    parameter_name = 'product'
+    lookup = 'product_id'
+    prefix_lookup = 'product__product_name'
@@ -0,0 +1,142 @@
+import asyncio
+import math
+import random
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from monitoring.metrics import record_cache_lookup
+
+# Cache access layer for expensive catalog entries.
+#
+# Entries are stored as (value, expires_at, delta, version) where delta is
+# how long the value took to compute. They physically live
+# CACHE_STALE_SECONDS past their logical expiry so that:
+#
+# * only the worker holding the per-key lock recomputes (single flight),
+# * other workers serve the stale value meanwhile, or wait briefly when
+#   there is nothing to serve,
+# * entries are refreshed early with a probability that grows as expiry
+#   approaches and with the cost of the computation ("XFetch"), which
+#   spreads refreshes of hot keys out instead of synchronising them.
+#
+# An entry stored under another version than the caller's (say, before a
+# catalog change) is treated as expired rather than missing: one worker
+# rebuilds it while the others keep serving the previous one.
+#
+# Only add/get/set/delete are used, so any Django backend works (locmem,
+# file, database, memcached, redis). A compute() returning None is not
+# stored. aget_or_set() is the same for coroutine computations.
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _acquire(cache, key):
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(key), token, settings.CACHE_LOCK_SECONDS):
+        return token
+    return None
+
+
+def _release(cache, key, token):
+    if cache.get(_lock_key(key)) == token:
+        cache.delete(_lock_key(key))
+
+
+def _store(cache, key, value, timeout, delta, version):
+    if value is not None:
+        cache.set(key, (value, time.time() + timeout, delta, version),
+                  timeout + settings.CACHE_STALE_SECONDS)
+
+
+def _compute(cache, key, compute, timeout, version):
+    start = time.time()
+    value = compute()
+    _store(cache, key, value, timeout, time.time() - start, version)
+    return value
+
+
+def _refresh_due(entry, version, beta):
+    value, expires_at, delta, stored_version = entry
+    if stored_version != version:
+        return True
+    return time.time() - delta * beta * math.log(1 - random.random()) >= expires_at
+
+
+def get_or_set(key, compute, timeout, name='default', using='default',
+               beta=None, version=None):
+    cache = caches[using]
+    beta = settings.CACHE_EARLY_REFRESH_BETA if beta is None else beta
+
+    entry = cache.get(key)
+    record_cache_lookup(name, entry is not None)
+    if entry is not None:
+        value = entry[0]
+        if not _refresh_due(entry, version, beta):
+            return value
+        token = _acquire(cache, key)
+        if token is None:
+            # Someone else is refreshing, serve what we have
+            return value
+        try:
+            return _compute(cache, key, compute, timeout, version)
+        finally:
+            _release(cache, key, token)
+
+    token = _acquire(cache, key)
+    if token is None:
+        deadline = time.time() + settings.CACHE_LOCK_WAIT_SECONDS
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        # The lock holder is slow or died; compute for this request only
+        return compute()
+    try:
+        return _compute(cache, key, compute, timeout, version)
+    finally:
+        _release(cache, key, token)
+
+
+async def aget_or_set(key, compute, timeout, name='default',
+                      using='default', beta=None, version=None):
+    cache = caches[using]
+    beta = settings.CACHE_EARLY_REFRESH_BETA if beta is None else beta
+
+    async def acompute(token):
+        try:
+            start = time.time()
+            value = await compute()
+            await sync_to_async(_store)(
+                cache, key, value, timeout, time.time() - start, version)
+            return value
+        finally:
+            await sync_to_async(_release)(cache, key, token)
+
+    entry = await cache.aget(key)
+    record_cache_lookup(name, entry is not None)
+    if entry is not None:
+        value = entry[0]
+        if not _refresh_due(entry, version, beta):
+            return value
+        token = await sync_to_async(_acquire)(cache, key)
+        if token is None:
+            return value
+        return await acompute(token)
+
+    token = await sync_to_async(_acquire)(cache, key)
+    if token is None:
+        deadline = time.time() + settings.CACHE_LOCK_WAIT_SECONDS
+        while time.time() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry[0]
+        return await compute()
+    return await acompute(token)
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.safestring import mark_safe
+
+from carts.context_processors import session_cart_count
+from store.cache import get_catalog_version
+from .cache import aget_or_set, get_or_set
+
+# Full-page cache for anonymous catalog pages. Pages are rendered once with
+# placeholders ("holes") for the per-visitor parts and stored; every request
+# then only fills the holes in the stored HTML.
+#
+# Pages are keyed by URL and stored with the catalog version they were
+# rendered under. After a catalog change the first request rebuilds a page
+# while concurrent ones still get the previous rendering.
+
+
+def placeholder(name):
+    return mark_safe(f'__page_cache_{name}__')
+
+
+def is_punching(request):
+    return getattr(request, 'page_cache_punch', False)
+
+
+def hole_punch(request):
+    """Context processor: hand out placeholders for the per-visitor values
+    while a page is rendered for the cache."""
+    if is_punching(request):
+        return {
+            'cart_count': placeholder('cart_count'),
+            'csrf_token': placeholder('csrf_token'),
+        }
+    return {}
+
+
+def _fill(request, content, cart_count):
+    holes = {
+        'cart_count': lambda: str(cart_count),
+        'csrf_token': lambda: get_token(request),
+    }
+    for name, value in holes.items():
+        marker = placeholder(name).encode()
+        if marker in content:
+            content = content.replace(marker, value().encode())
+    return content
+
+
+def _page_key(request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'page:{url}'
+
+
+def _bypass(request):
+    return (
+        not settings.PAGE_CACHE_ENABLED
+        or request.method not in ('GET', 'HEAD')
+        or request.user.is_authenticated
+        or CookieStorage.cookie_name in request.COOKIES
+    )
+
+
+def _lookup(request):
+    """Return (cart_count, cache key, catalog version), or None when the
+    cache is bypassed."""
+    if _bypass(request):
+        return None
+    cart_count = session_cart_count(request)
+    if cart_count and settings.PAGE_CACHE_BYPASS_NON_EMPTY_CART:
+        return None
+    return cart_count, _page_key(request), get_catalog_version()
+
+
+def _entry(response):
+    if response.status_code != 200 or response.streaming:
+        return None
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+    }
+
+
+def _respond(request, entry, response, cart_count):
+    if entry is None:
+        # Rendered for this request but not cacheable
+        if not response.streaming:
+            response.content = _fill(request, response.content, cart_count)
+        return response
+    return HttpResponse(
+        _fill(request, entry['content'], cart_count),
+        content_type=entry['content_type'],
+    )
+
+
+def cache_anonymous_page(view_func):
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            lookup = await sync_to_async(_lookup)(request)
+            if lookup is None:
+                return await view_func(request, *args, **kwargs)
+            cart_count, key, version = lookup
+            response = None
+
+            async def render_page():
+                nonlocal response
+                request.page_cache_punch = True
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                finally:
+                    request.page_cache_punch = False
+                return _entry(response)
+
+            entry = await aget_or_set(
+                key, render_page, settings.PAGE_CACHE_TIMEOUT, name='page',
+                version=version)
+            return _respond(request, entry, response, cart_count)
+        return _wrapped_async_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        lookup = _lookup(request)
+        if lookup is None:
+            return view_func(request, *args, **kwargs)
+        cart_count, key, version = lookup
+        response = None
+
+        def render_page():
+            nonlocal response
+            request.page_cache_punch = True
+            try:
+                response = view_func(request, *args, **kwargs)
+            finally:
+                request.page_cache_punch = False
+            return _entry(response)
+
+        entry = get_or_set(
+            key, render_page, settings.PAGE_CACHE_TIMEOUT, name='page',
+            version=version)
+        return _respond(request, entry, response, cart_count)
+    return _wrapped_view
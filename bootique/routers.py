@@ -0,0 +1,123 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Catalog reads go to a replica; everything else, every write and the whole
+# request after a write go to the primary ("default"). A visitor who wrote
+# something stays on the primary for REPLICA_PIN_SECONDS through a cookie,
+# so they always read their own writes despite replication lag. Requests
+# under PRIMARY_DB_PATHS (cart and checkout) are pinned before the view runs.
+#
+# Outside of a request (shell, management commands) all reads use the
+# primary.
+
+CATALOG_MODELS = {
+    ('store', 'product'),
+    ('store', 'variation'),
+    ('store', 'reviewrating'),
+    ('store', 'productgallery'),
+    ('category', 'category'),
+}
+
+# Writes that don't make a visitor expect fresh catalog reads
+IGNORED_WRITE_APPS = {'sessions', 'monitoring'}
+
+PIN_COOKIE = 'primary_db_until'
+
+
+class RequestState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# A mutable state object (rather than a bare flag) so writes made in
+# sync_to_async threads are seen by the request that started them.
+_request_state = ContextVar('db_request_state', default=None)
+
+
+def begin_request(pinned=False):
+    return _request_state.set(RequestState(pinned))
+
+
+def end_request(token):
+    _request_state.reset(token)
+
+
+def current_state():
+    return _request_state.get()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        replicas = settings.DATABASE_REPLICA_ALIASES
+        if (state is None or state.pinned or state.wrote or not replicas):
+            return 'default'
+        if (model._meta.app_label, model._meta.model_name) in CATALOG_MODELS:
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.app_label not in IGNORED_WRITE_APPS:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICA_ALIASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in settings.DATABASE_REPLICA_ALIASES:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self.begin(request)
+        try:
+            return self.pin(self.get_response(request))
+        finally:
+            end_request(token)
+
+    async def __acall__(self, request):
+        token = self.begin(request)
+        try:
+            return self.pin(await self.get_response(request))
+        finally:
+            end_request(token)
+
+    def begin(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        if request.path_info.startswith(settings.PRIMARY_DB_PATHS):
+            pinned = True
+        return begin_request(pinned)
+
+    def pin(self, response):
+        if current_state().wrote:
+            window = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, str(time.time() + window),
+                                max_age=window, httponly=True,
+                                samesite='Lax')
+        return response
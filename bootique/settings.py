@@ -10,9 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from django.contrib.messages import constants as messages
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
@@ -44,11 +45,15 @@ INSTALLED_APPS = [
     'store',
     'carts',
     'orders',
+    'monitoring',
     'admin_honeypot',
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
+    'monitoring.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'bootique.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,6 +82,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'category.context_processors.menu_links',
                 'carts.context_processors.counter',
+                'bootique.page_cache.hole_punch',
             ],
         },
     },
@@ -84,6 +90,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'bootique.wsgi.application'
 
+# Route the catalog, search and home pages to their async views
+# (bootique.asgi turns this on)
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 AUTH_USER_MODEL = 'accounts.Account'
 
 # Database
@@ -92,10 +102,93 @@ AUTH_USER_MODEL = 'accounts.Account'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+    }
+}
+
+# SQLite production mode: WAL, busy timeout, synchronous=NORMAL, mmap and
+# BEGIN IMMEDIATE for the cart and order write transactions, which are
+# retried SQLITE_WRITE_RETRIES times when the database stays locked.
+SQLITE_PRODUCTION_MODE = config(
+    'SQLITE_PRODUCTION_MODE', default=False, cast=bool)
+SQLITE_BUSY_TIMEOUT_MS = config(
+    'SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int)
+SQLITE_MMAP_SIZE = config(
+    'SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)
+SQLITE_WRITE_RETRIES = config('SQLITE_WRITE_RETRIES', default=3, cast=int)
+if SQLITE_PRODUCTION_MODE:
+    DATABASES['default']['ENGINE'] = 'bootique.sqlite_backend'
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+    }
+
+# Read replicas for catalog reads (bootique.routers). DATABASE_REPLICAS is a
+# comma separated list of database names using the primary's engine, e.g.
+# two local SQLite files: DATABASE_REPLICAS=replica.sqlite3
+DATABASE_REPLICA_ALIASES = []
+for i, name in enumerate(config('DATABASE_REPLICAS', default='', cast=Csv()), 1):
+    alias = f'replica{i}'
+    DATABASES[alias] = dict(
+        DATABASES['default'], NAME=name, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICA_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ['bootique.routers.PrimaryReplicaRouter']
+
+# Seconds a visitor keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=15, cast=int)
+
+# URL prefixes whose requests read everything from the primary: the cart and
+# checkout flows check stock and prices that must not lag behind
+PRIMARY_DB_PATHS = ('/cart/', '/orders/')
+
+CACHES = {
+    'default': {
+        'BACKEND': config(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='bootique'),
     }
 }
 
+# Stampede protection for expensive entries (bootique.cache)
+CACHE_STALE_SECONDS = config('CACHE_STALE_SECONDS', default=60, cast=int)
+CACHE_LOCK_SECONDS = config('CACHE_LOCK_SECONDS', default=10, cast=int)
+CACHE_LOCK_WAIT_SECONDS = config(
+    'CACHE_LOCK_WAIT_SECONDS', default=2, cast=float)
+CACHE_EARLY_REFRESH_BETA = config(
+    'CACHE_EARLY_REFRESH_BETA', default=1.0, cast=float)
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Anonymous full-page cache for the catalog pages (bootique.page_cache)
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', default=True, cast=bool)
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=300, cast=int)
+PAGE_CACHE_BYPASS_NON_EMPTY_CART = config(
+    'PAGE_CACHE_BYPASS_NON_EMPTY_CART', default=False, cast=bool)
+
+# Order numbers each process takes from the day's counter at a time
+# (orders.numbers)
+ORDER_NUMBER_BLOCK = config('ORDER_NUMBER_BLOCK', default=20, cast=int)
+
+# Minutes place_order holds stock for an unpaid order (orders.inventory)
+RESERVATION_TTL_MINUTES = config(
+    'RESERVATION_TTL_MINUTES', default=15, cast=int)
+
+# Buffered product view counts and their popularity score (store.popularity)
+PRODUCT_VIEW_FLUSH_SECONDS = config(
+    'PRODUCT_VIEW_FLUSH_SECONDS', default=30, cast=int)
+PRODUCT_VIEW_FLUSH_SIZE = config(
+    'PRODUCT_VIEW_FLUSH_SIZE', default=1000, cast=int)
+POPULARITY_HALF_LIFE_DAYS = config(
+    'POPULARITY_HALF_LIFE_DAYS', default=7, cast=float)
+
+# Stock counter rows per product flagged is_hot (store.stock)
+STOCK_SHARDS = config('STOCK_SHARDS', default=8, cast=int)
+
+# Read-only JSON catalog API (store.api)
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=20, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=500, cast=int)
+API_STREAM_BATCH_SIZE = config('API_STREAM_BATCH_SIZE', default=100, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -155,3 +248,42 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+# Metrics
+# Point PROMETHEUS_MULTIPROC_DIR at an empty directory shared by all workers
+# of a node so /metrics aggregates them. Wipe it on every deploy.
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if PROMETHEUS_MULTIPROC_DIR:
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)
+# /metrics needs "Authorization: Bearer <METRICS_TOKEN>" and is closed while
+# the token is unset. METRICS_ALLOWED_IPS optionally narrows it further, but
+# behind the Elastic Beanstalk nginx every request comes from 127.0.0.1.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+
+# Slow query log
+SLOW_QUERY_THRESHOLD_MS = config(
+    'SLOW_QUERY_THRESHOLD_MS', default=200, cast=int)
+SLOW_QUERY_LOG_FILE = config(
+    'SLOW_QUERY_LOG_FILE', default=str(BASE_DIR / 'slow_queries.log'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'monitoring.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
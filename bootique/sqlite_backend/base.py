@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite tuned for concurrent web traffic (SQLITE_PRODUCTION_MODE).
+
+    WAL lets readers run next to the single writer, busy_timeout makes
+    writers queue instead of failing at once, and write transactions
+    opened through bootique.transactions take the write lock up front with
+    BEGIN IMMEDIATE, so they cannot deadlock upgrading from a read lock.
+    """
+
+    # Set by bootique.transactions.immediate_atomic for the next BEGIN
+    begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(
+            f'PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.begin_immediate:
+            # On the raw connection: execute wrappers (slow query logging)
+            # must not run queries while the transaction is still opening
+            self.connection.execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -46,6 +46,57 @@ $(document).ready(function() {
 
 
 
+	//////////////////////// Cart updates without a page reload
+    // The cart views answer with a JSON delta when asked for JSON; without
+    // JavaScript the forms and links fall back to the full page flow.
+    function updateCart(data) {
+        $('.notify').text(data.cart_count);
+        var row = $('tr[data-cart-item="' + data.item_id + '"]');
+        if ($('.table-shopping-cart').length && !data.item) {
+            row.remove();
+            if (!$('tr[data-cart-item]').length) {
+                window.location.reload();
+            }
+        } else if (data.item) {
+            if (!row.length && $('.table-shopping-cart').length) {
+                window.location.reload();
+            }
+            row.find('.js-cart-quantity').val(data.item.quantity);
+            row.find('.js-cart-subtotal').text('$ ' + data.item.sub_total);
+        }
+        $('.js-cart-total').text('$ ' + data.total);
+        $('.js-cart-tax').text('$ ' + data.tax);
+        $('.js-cart-grand-total').text('$ ' + data.grand_total);
+    }
+
+    $(document).on('submit', '.js-cart-form', function (e) {
+        e.preventDefault();
+        var form = $(this);
+        var button = form.find('[type=submit]').prop('disabled', true);
+        $.ajax({
+            url: form.attr('action'),
+            method: 'POST',
+            data: form.serialize(),
+            dataType: 'json'
+        }).done(updateCart).fail(function () {
+            form[0].submit();  // native submit skips this handler
+        }).always(function () {
+            button.prop('disabled', false);
+        });
+    });
+
+    $(document).on('click', '.js-cart-link', function (e) {
+        if (e.isDefaultPrevented()) {
+            return;  // e.g. the remove confirmation was cancelled
+        }
+        e.preventDefault();
+        var href = $(this).attr('href');
+        $.ajax({url: href, dataType: 'json'}).done(updateCart).fail(function () {
+            window.location = href;
+        });
+    });
+
+
 	//////////////////////// Bootstrap tooltip
 	if($('[data-toggle="tooltip"]').length>0) {  // check if element exists
 		$('[data-toggle="tooltip"]').tooltip()
@@ -0,0 +1,263 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from asgiref.sync import (async_to_sync, iscoroutinefunction,
+                          sync_to_async)
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import OperationalError, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from prometheus_client import REGISTRY
+
+from accounts.models import Account
+from carts.models import Cart
+from category.models import Category
+from orders.models import Order
+from store.models import Product
+from .admin_tools import EstimatedCountPaginator, estimated_count
+from .cache import _acquire, _release, aget_or_set, get_or_set
+from .routers import (PIN_COOKIE, PrimaryReplicaRouter,
+                      ReplicaPinningMiddleware, begin_request, current_state,
+                      end_request)
+from .transactions import write_transaction
+
+
+class CoalescingCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh', delay=0):
+        def _compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return _compute
+
+    def test_miss_then_hit(self):
+        self.assertEqual(get_or_set('k', self.compute(), 60), 'fresh')
+        self.assertEqual(get_or_set('k', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_none_is_not_stored(self):
+        get_or_set('k', self.compute(None), 60)
+        get_or_set('k', self.compute(None), 60)
+        self.assertEqual(self.calls, 2)
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+
+        def worker():
+            results.append(get_or_set('k', self.compute(delay=0.3), 60))
+
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_refreshing(self):
+        cache.set('k', ('stale', time.time() - 1, 0.1, None), 60)
+        _acquire(cache, 'k')
+        self.assertEqual(get_or_set('k', self.compute(), 60), 'stale')
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_value_recomputed_by_lock_holder(self):
+        cache.set('k', ('stale', time.time() - 1, 0.1, None), 60)
+        self.assertEqual(get_or_set('k', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_probabilistic_early_refresh(self):
+        cache.set('k', ('old', time.time() + 5, 1.0, None), 60)
+        self.assertEqual(get_or_set('k', self.compute(), 60, beta=0), 'old')
+        self.assertEqual(
+            get_or_set('k', self.compute(), 60, beta=1000), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_previous_version_served_while_rebuilding(self):
+        get_or_set('k', self.compute('v1'), 60, version=1)
+        token = _acquire(cache, 'k')
+        self.assertEqual(
+            get_or_set('k', self.compute('v2'), 60, version=2), 'v1')
+        _release(cache, 'k', token)
+        self.assertEqual(
+            get_or_set('k', self.compute('v2'), 60, version=2), 'v2')
+        self.assertEqual(
+            get_or_set('k', self.compute('v3'), 60, version=2), 'v2')
+        self.assertEqual(self.calls, 2)
+
+    async def test_async_concurrent_misses_compute_once(self):
+        async def compute():
+            self.calls += 1
+            await asyncio.sleep(0.2)
+            return 'fresh'
+
+        results = await asyncio.gather(
+            *[aget_or_set('k', compute, 60) for i in range(5)])
+        self.assertEqual(results, ['fresh'] * 5)
+        self.assertEqual(await aget_or_set('k', compute, 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+
+class CoalescingCacheBackendsTest(TestCase):
+    def check_backend(self):
+        caches['default'].clear()
+        self.assertEqual(get_or_set('k', lambda: [1, 2], 60), [1, 2])
+        self.assertEqual(get_or_set('k', lambda: [3], 60), [1, 2])
+        self.assertIsNone(_acquire(caches['default'], 'k') and
+                          _acquire(caches['default'], 'k'))
+
+    def test_file_based_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location}}):
+            self.check_backend()
+
+    def test_database_cache(self):
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                'LOCATION': 'test_cache_table'}}):
+            call_command('createcachetable', verbosity=0)
+            self.check_backend()
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=['replica1'], REPLICA_PIN_SECONDS=15)
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def in_request(self, pinned=False):
+        token = begin_request(pinned)
+        self.addCleanup(end_request, token)
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_catalog_reads_use_replica(self):
+        self.in_request()
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+        self.assertEqual(self.router.db_for_read(Category), 'replica1')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertEqual(self.router.db_for_read(Cart), 'default')
+
+    def test_reads_after_write_use_primary(self):
+        self.in_request()
+        self.assertEqual(self.router.db_for_write(Cart), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_session_writes_do_not_pin(self):
+        from django.contrib.sessions.models import Session
+        self.in_request()
+        self.router.db_for_write(Session)
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+
+    def test_pinned_request_uses_primary(self):
+        self.in_request(pinned=True)
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_middleware_pins_after_write(self):
+        def write_view(request):
+            self.router.db_for_write(Account)
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        response = ReplicaPinningMiddleware(write_view)(request)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 15)
+        self.assertIsNone(current_state())
+
+        def read_view(request):
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        response = ReplicaPinningMiddleware(read_view)(request)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_cart_and_checkout_read_from_primary(self):
+        def read_view(request):
+            return HttpResponse(self.router.db_for_read(Product))
+
+        middleware = ReplicaPinningMiddleware(read_view)
+        for path, db in [('/cart/', b'default'),
+                         ('/cart/checkout/', b'default'),
+                         ('/orders/place_order/', b'default'),
+                         ('/store/', b'replica1')]:
+            response = middleware(RequestFactory().get(path))
+            self.assertEqual(response.content, db, path)
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_middleware_runs_async(self):
+        async def write_view(request):
+            # Writes made in sync_to_async threads pin the visitor too
+            await sync_to_async(self.router.db_for_write)(Account)
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(write_view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertIsNone(current_state())
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        for i in range(3):
+            Product.objects.create(
+                product_name=f'Product {i}', slug=f'product-{i}', price=10,
+                stock=1, category=category,
+                images='photos/products/test.jpg')
+
+    def test_unfiltered_large_table_uses_the_estimate(self):
+        with patch('bootique.admin_tools.estimated_count',
+                   return_value=2000000):
+            paginator = EstimatedCountPaginator(Product.objects.all(), 20)
+            self.assertEqual(paginator.count, 2000000)
+            filtered = EstimatedCountPaginator(
+                Product.objects.filter(stock=1), 20)
+            self.assertEqual(filtered.count, 3)
+
+    def test_small_or_unknown_tables_are_counted(self):
+        with patch('bootique.admin_tools.estimated_count', return_value=50):
+            self.assertEqual(
+                EstimatedCountPaginator(Product.objects.all(), 20).count, 3)
+        # SQLite keeps no row estimate
+        self.assertIsNone(estimated_count(Product))
+        self.assertEqual(
+            EstimatedCountPaginator(Product.objects.all(), 20).count, 3)
+
+
+class WriteTransactionTest(TestCase):
+    @override_settings(SQLITE_PRODUCTION_MODE=True, SQLITE_WRITE_RETRIES=2)
+    def test_retried_view_runs_side_effects_once(self):
+        calls, effects = [], []
+
+        @write_transaction
+        def busy_view(request):
+            calls.append(request)
+            transaction.on_commit(lambda: effects.append(request))
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return HttpResponse()
+
+        labels = {'view': 'busy_view'}
+        before = REGISTRY.get_sample_value(
+            'bootique_write_transaction_retries_total', labels) or 0
+        with self.captureOnCommitCallbacks(execute=True):
+            busy_view(RequestFactory().post('/'))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(effects), 1)
+        self.assertEqual(REGISTRY.get_sample_value(
+            'bootique_write_transaction_retries_total', labels), before + 1)
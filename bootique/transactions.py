@@ -0,0 +1,59 @@
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+from monitoring.metrics import WRITE_RETRIES
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+@contextmanager
+def immediate_atomic(using='default'):
+    """
+    transaction.atomic() that starts with BEGIN IMMEDIATE on the SQLite
+    production backend. Anywhere else it is a plain atomic block.
+    """
+    connection = connections[using]
+    immediate = (hasattr(connection, 'begin_immediate')
+                 and not connection.in_atomic_block)
+    if immediate:
+        connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            if immediate:
+                connection.begin_immediate = False
+            yield
+    finally:
+        if immediate:
+            connection.begin_immediate = False
+
+
+def write_transaction(view_func):
+    """
+    Run a view that writes in one transaction. On SQLite production mode
+    the transaction takes the write lock up front and the whole view is
+    retried a few times with backoff when the database stays busy, so
+    side effects outside the database belong in transaction.on_commit().
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        attempts = 1
+        if settings.SQLITE_PRODUCTION_MODE:
+            attempts += settings.SQLITE_WRITE_RETRIES
+        for attempt in range(attempts):
+            try:
+                with immediate_atomic():
+                    return view_func(request, *args, **kwargs)
+            except OperationalError as e:
+                if not _is_busy(e) or attempt == attempts - 1:
+                    raise
+                WRITE_RETRIES.labels(view_func.__name__).inc()
+                time.sleep(0.05 * 2 ** attempt * (1 + random.random()))
+    return _wrapped_view
@@ -22,11 +22,18 @@ from django.conf import settings
 urlpatterns = [
     path('admin/', include('admin_honeypot.urls', namespace='admin_honeypot')),
     path('securelogin/', admin.site.urls),
-    path('', views.home, name='home'),
+    path('', views.home_async if settings.ASYNC_VIEWS else views.home,
+         name='home'),
     path('store/', include('store.urls')),
     path('cart/', include('carts.urls')),
     path('accounts/', include('accounts.urls')),
 
     # ORDERS
     path('orders/', include('orders.urls')),
+
+    # API
+    path('api/', include('store.api_urls')),
+
+    # MONITORING
+    path('metrics', include('monitoring.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,19 +1,33 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from store.models import Product, ReviewRating
+from store.models import Product
+from .page_cache import cache_anonymous_page
 
 
+@cache_anonymous_page
 def home(request):
-    products = Product.objects.all().filter(is_available=True)
-
-    # Get the reviews
-    reviews = None
-    for product in products:
-        reviews = ReviewRating.objects.filter(
-            product_id=product.id, status=True)
+    # Ratings are aggregated in the same query and rendered by the
+    # star_rating tag, instead of two queries per product card. The most
+    # viewed products lately come first.
+    products = Product.objects.with_rating().filter(
+        is_available=True).select_related('category').order_by(
+        '-popularity', 'id')
 
     context = {
         'products': products,
-        'reviews': reviews,
     }
 
     return render(request, "home.html", context)
+
+
+@cache_anonymous_page
+async def home_async(request):
+    products = Product.objects.with_rating().filter(
+        is_available=True).select_related('category').order_by(
+        '-popularity', 'id')
+
+    context = {
+        'products': [product async for product in products],
+    }
+
+    return await sync_to_async(render)(request, "home.html", context)
@@ -1,3 +1,4 @@
+from django.db.models import Sum
 from .models import Cart, CartItem
 from .views import _cart_id
 
@@ -6,6 +7,9 @@ def counter(request):
     cart_count = 0
     if 'admin' in request.path:
         return {}
+    elif getattr(request, 'page_cache_punch', False):
+        # bootique.page_cache fills the badge per request
+        return {}
     else:
         try:
             cart = Cart.objects.filter(cart_id=_cart_id(request))
@@ -18,3 +22,13 @@ def counter(request):
         except Cart.DoesNotExist:
             cart_count = 0
     return dict(cart_count=cart_count)
+
+
+def session_cart_count(request):
+    # Cart badge for anonymous visitors, without creating a session
+    session_key = request.session.session_key
+    if not session_key:
+        return 0
+    cart_count = CartItem.objects.filter(
+        cart__cart_id=session_key).aggregate(total=Sum('quantity'))['total']
+    return cart_count or 0
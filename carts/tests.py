@@ -243,3 +243,57 @@ class CartСheckoutTest(TestCase):
         self.assertEqual(len(response.context['cart_items']), 0)
         self.assertEqual(response.context['tax'], 0)
         self.assertEqual(response.context['grand_total'], 0)
+
+
+class CartJsonDeltaTest(TestCase):
+    def setUp(self):
+        self.client = Client(HTTP_ACCEPT='application/json')
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=10, category=self.category,
+            images='photos/products/test.jpg')
+
+    def test_add_returns_changed_line_and_totals(self):
+        self.client.post(reverse('add_to_cart', args=[self.product.id]))
+        response = self.client.post(
+            reverse('add_to_cart', args=[self.product.id]))
+        item = CartItem.objects.get()
+        self.assertEqual(response.json(), {
+            'item_id': item.id,
+            'item': {'id': item.id, 'quantity': 2, 'sub_total': 100},
+            'total': 100,
+            'quantity': 2,
+            'tax': 20.0,
+            'grand_total': 120.0,
+            'cart_count': 2,
+        })
+
+    def test_subtract_and_remove(self):
+        self.client.post(reverse('add_to_cart', args=[self.product.id]))
+        self.client.post(reverse('add_to_cart', args=[self.product.id]))
+        item = CartItem.objects.get()
+        response = self.client.get(
+            reverse('subtract_from_cart', args=[self.product.id, item.id]))
+        self.assertEqual(response.json()['item']['quantity'], 1)
+        self.assertEqual(response.json()['cart_count'], 1)
+        response = self.client.get(
+            reverse('remove_from_cart', args=[self.product.id, item.id]))
+        self.assertEqual(response.json()['item_id'], item.id)
+        self.assertIsNone(response.json()['item'])
+        self.assertEqual(response.json()['grand_total'], 0)
+
+    def test_mutation_skips_cart_page_render(self):
+        response = self.client.post(
+            reverse('add_to_cart', args=[self.product.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.templates, [])
+        self.assertIn('Accept', response['Vary'])
+
+    def test_html_clients_still_redirect(self):
+        response = Client().post(
+            reverse('add_to_cart', args=[self.product.id]))
+        self.assertRedirects(response, reverse('cart'))
+        self.assertIn('Accept', response['Vary'])
@@ -1,7 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
 from store.models import Product, Variation
 from .models import Cart, CartItem
 from django.contrib.auth.decorators import login_required
+from monitoring.metrics import ADD_TO_CART, CARTS_CREATED
+from bootique.transactions import write_transaction
 
 # Create your views here.
 from django.http import HttpResponse
@@ -14,7 +20,51 @@ def _cart_id(request):
     return cart
 
 
+def _cart_response(request, cart_item, cart_item_id=None):
+    # Cart mutations answer fetch() calls that ask for JSON with just the
+    # changed line and the new totals instead of redirecting to the cart
+    if 'application/json' not in request.headers.get('Accept', ''):
+        response = redirect('cart')
+        patch_vary_headers(response, ['Accept'])
+        return response
+    if request.user.is_authenticated:
+        cart_items = CartItem.objects.filter(
+            user=request.user, is_active=True)
+    else:
+        cart_items = CartItem.objects.filter(
+            cart__cart_id=_cart_id(request), is_active=True)
+    totals = cart_items.aggregate(
+        total=Sum(F('product__price') * F('quantity')),
+        quantity=Sum('quantity'))
+    total = totals['total'] or 0
+    quantity = totals['quantity'] or 0
+    tax = 0.2 * total
+
+    item = None
+    if cart_item is not None and cart_item.pk is not None:
+        cart_item_id = cart_item.id
+        item = {
+            'id': cart_item.id,
+            'quantity': cart_item.quantity,
+            'sub_total': cart_item.sub_total(),
+        }
+    response = JsonResponse({
+        'item_id': cart_item_id,
+        'item': item,
+        'total': total,
+        'quantity': quantity,
+        'tax': tax,
+        'grand_total': total + tax,
+        'cart_count': quantity,
+    })
+    # The same URL answers with a redirect or JSON depending on Accept
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@write_transaction
 def add_to_cart(request, product_id):
+    transaction.on_commit(ADD_TO_CART.inc)
     current_user = request.user
     product = Product.objects.get(id=product_id)  # get the product
 
@@ -70,7 +120,8 @@ def add_to_cart(request, product_id):
                 cart_item.variations.clear()
                 cart_item.variations.add(*product_variation)
             cart_item.save()
-        return redirect('cart')
+        return _cart_response(
+            request, item if is_cart_item_exists else cart_item)
 
     # If the user is notauthenticated
     else:
@@ -94,6 +145,7 @@ def add_to_cart(request, product_id):
             cart = Cart.objects.create(
                 cart_id=_cart_id(request)
             )
+            transaction.on_commit(CARTS_CREATED.inc)
         cart.save()
 
         is_cart_item_exists = CartItem.objects.filter(
@@ -137,11 +189,14 @@ def add_to_cart(request, product_id):
                 cart_item.variations.clear()
                 cart_item.variations.add(*product_variation)
             cart_item.save()
-        return redirect('cart')
+        return _cart_response(
+            request, item if is_cart_item_exists else cart_item)
 
 
+@write_transaction
 def subtract_from_cart(request, product_id, cart_item_id):
     product = get_object_or_404(Product, id=product_id)
+    cart_item = None
     try:
         if request.user.is_authenticated:
             cart_item = CartItem.objects.get(
@@ -157,9 +212,10 @@ def subtract_from_cart(request, product_id, cart_item_id):
             cart_item.delete()
     except:
         pass
-    return redirect('cart')
+    return _cart_response(request, cart_item, cart_item_id)
 
 
+@write_transaction
 def remove_from_cart(request, product_id, cart_item_id):
     product = get_object_or_404(Product, id=product_id)
     if request.user.is_authenticated:
@@ -170,7 +226,7 @@ def remove_from_cart(request, product_id, cart_item_id):
         cart_item = CartItem.objects.get(
             product=product, cart=cart, id=cart_item_id)
     cart_item.delete()
-    return redirect('cart')
+    return _cart_response(request, cart_item, cart_item_id)
 
 
 def cart(request, total=0, quantity=0, cart_items=None):
@@ -7,6 +7,7 @@ from .models import Category
 class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('category_name',)}
     list_display = ('category_name', 'slug')
+    search_fields = ('^category_name',)
 
 
 admin.site.register(Category, CategoryAdmin)
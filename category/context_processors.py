@@ -1,6 +1,15 @@
+from django.conf import settings
+from bootique.cache import get_or_set
+from store.cache import get_catalog_version
 from .models import Category
 
 
 def menu_links(request):
-    links = Category.objects.all()
+    links = get_or_set(
+        'menu_links',
+        lambda: list(Category.objects.all()),
+        settings.CATALOG_CACHE_TIMEOUT,
+        name='menu_links',
+        version=get_catalog_version(),
+    )
     return dict(links=links)
@@ -0,0 +1,20 @@
+from django.contrib import admin
+from .models import SlowQuery
+
+# Register your models here.
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'duration_ms', 'view',
+                    'location', 'database')
+    list_filter = ('view', 'database')
+    readonly_fields = ('database', 'view', 'location', 'sql', 'params',
+                       'explain', 'duration_ms', 'created_at')
+    ordering = ('-created_at',)
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(SlowQuery, SlowQueryAdmin)
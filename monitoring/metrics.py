@@ -0,0 +1,55 @@
+import os
+
+from prometheus_client import (REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+# Metrics are process local unless PROMETHEUS_MULTIPROC_DIR is set before the
+# workers start, in which case every worker writes to the shared directory and
+# the /metrics view merges them into a single scrape for the node.
+
+REQUEST_LATENCY = Histogram(
+    'bootique_request_latency_seconds',
+    'Request latency per view',
+    ['view', 'method'],
+)
+DB_QUERIES = Histogram(
+    'bootique_db_queries_per_request',
+    'Database queries executed per request',
+    ['view'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, float('inf')),
+)
+CACHE_LOOKUPS = Counter(
+    'bootique_cache_lookups',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result'],
+)
+SESSIONS_CREATED = Counter(
+    'bootique_sessions_created',
+    'Sessions created',
+)
+WRITE_RETRIES = Counter(
+    'bootique_write_transaction_retries',
+    'Write transactions retried because the database was busy',
+    ['view'],
+)
+
+# Business throughput, counted when the view's transaction commits so a
+# retried write_transaction view counts once
+CARTS_CREATED = Counter('bootique_carts_created', 'Carts created')
+ADD_TO_CART = Counter('bootique_add_to_cart', 'add_to_cart calls')
+ORDERS_PLACED = Counter('bootique_orders_placed', 'Orders placed')
+PAYMENTS_CONFIRMED = Counter(
+    'bootique_payments_confirmed', 'Payments confirmed')
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render_metrics():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
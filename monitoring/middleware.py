@@ -0,0 +1,119 @@
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+
+from .metrics import DB_QUERIES, REQUEST_LATENCY, SESSIONS_CREATED
+from .slow_queries import SlowQueryLogger
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name
+
+
+@asynccontextmanager
+async def _in_sync_thread(context):
+    """
+    Enter a sync context manager in the thread that runs the request's
+    sync code. Database connections belong to a thread, so the query
+    wrappers must be installed where the ORM will run the queries.
+    """
+    await sync_to_async(context.__enter__)()
+    try:
+        yield
+    except BaseException as e:
+        if not await sync_to_async(context.__exit__)(
+                type(e), e, e.__traceback__):
+            raise
+    else:
+        await sync_to_async(context.__exit__)(None, None, None)
+
+
+class MetricsMiddleware:
+    """
+    Records latency and query counts per view. Keep it at the top of
+    MIDDLEWARE so the timings cover the whole stack and new sessions are
+    already saved when the response comes back.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with self.measure(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        async with _in_sync_thread(self.measure(request)):
+            return await self.get_response(request)
+
+    @contextmanager
+    def measure(self, request):
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        had_session = settings.SESSION_COOKIE_NAME in request.COOKIES
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(count_queries))
+            yield
+        elapsed = time.perf_counter() - start
+
+        view = _view_name(request)
+        REQUEST_LATENCY.labels(view, request.method).observe(elapsed)
+        DB_QUERIES.labels(view).observe(queries[0])
+
+        session = getattr(request, 'session', None)
+        if not had_session and session is not None and session.session_key:
+            SESSIONS_CREATED.inc()
+
+
+class SlowQueryMiddleware:
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with self.log_slow_queries(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        async with _in_sync_thread(self.log_slow_queries(request)):
+            return await self.get_response(request)
+
+    @contextmanager
+    def log_slow_queries(self, request):
+        loggers = [SlowQueryLogger(alias, request) for alias in connections]
+        try:
+            with ExitStack() as stack:
+                for query_logger in loggers:
+                    stack.enter_context(connections[
+                        query_logger.alias].execute_wrapper(query_logger))
+                yield
+        finally:
+            # After the response, outside of the view's transactions
+            for query_logger in loggers:
+                query_logger.save()
@@ -0,0 +1,21 @@
+from django.db import models
+
+# Create your models here.
+
+
+class SlowQuery(models.Model):
+    database = models.CharField(max_length=50)
+    view = models.CharField(max_length=200, blank=True)
+    location = models.CharField(max_length=255, blank=True)
+    sql = models.TextField()
+    params = models.TextField(blank=True)
+    explain = models.TextField(blank=True)
+    duration_ms = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'slow query'
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f'{self.duration_ms:.0f} ms {self.view}'
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+logger = logging.getLogger('monitoring.slow_queries')
+
+# Set while slow queries are being saved so the EXPLAIN and the log row
+# insert are not timed (and logged) themselves.
+_state = threading.local()
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def _code_location():
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = frame.filename
+        if not filename.startswith(base_dir) or 'site-packages' in filename:
+            continue
+        if filename.endswith(('slow_queries.py', 'middleware.py')):
+            continue
+        return f'{filename[len(base_dir) + 1:]}:{frame.lineno} in {frame.name}'
+    return ''
+
+
+def _explain(connection, sql, params):
+    prefix = EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+    return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+
+class SlowQueryLogger:
+    """
+    Execute wrapper that notes every query slower than
+    SLOW_QUERY_THRESHOLD_MS with the view and the calling code. The plan
+    is read and the rows are stored by save(), once the request is done:
+    a query inside the wrapper could land in a transaction that is still
+    being opened.
+    """
+
+    def __init__(self, alias, request=None):
+        self.alias = alias
+        self.request = request
+        self.slow = []
+
+    @property
+    def view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match is not None else ''
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_state, 'recording', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+            self.slow.append(
+                (sql, params, many, duration_ms, _code_location()))
+        return result
+
+    def save(self):
+        slow, self.slow = self.slow, []
+        if not slow:
+            return
+        _state.recording = True
+        try:
+            for query in slow:
+                self.record(*query)
+        finally:
+            _state.recording = False
+
+    def record(self, sql, params, many, duration_ms, location):
+        from .models import SlowQuery
+
+        connection = connections[self.alias]
+        view = self.view
+        explain = '' if many else _explain(connection, sql, params)
+        logger.warning(
+            '%.1f ms [%s] %s at %s\n%s\nparams=%r\n%s',
+            duration_ms, self.alias, view, location, sql, params, explain,
+        )
+        try:
+            with transaction.atomic(using=self.alias):
+                SlowQuery.objects.create(
+                    database=self.alias,
+                    view=view,
+                    location=location[:255],
+                    sql=sql,
+                    params=repr(params),
+                    explain=explain,
+                    duration_ms=duration_ms,
+                )
+        except DatabaseError:
+            logger.exception('Could not store slow query')
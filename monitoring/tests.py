@@ -0,0 +1,142 @@
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from store.models import Product
+from category.models import Category
+from django.db import connection, transaction
+from .models import SlowQuery
+from .slow_queries import SlowQueryLogger
+
+# Create your tests here.
+
+
+class MetricsViewTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product',
+            slug='test-product',
+            price=100,
+            stock=10,
+            category=self.category,
+            images='photos/products/test.jpg',
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_exposition(self):
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertContains(response, 'bootique_request_latency_seconds')
+        self.assertContains(response, 'bootique_orders_placed_total')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_need_the_token(self):
+        # Behind a local proxy every request comes from 127.0.0.1
+        for authorization in ('', 'Bearer wrong', 'Basic secret'):
+            response = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION=authorization)
+            self.assertEqual(response.status_code, 403)
+
+    def test_metrics_closed_without_a_token(self):
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(
+        METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_metrics_forbidden_for_other_hosts(self):
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.1.2.3',
+            HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 403)
+
+    def test_request_latency_and_queries_recorded(self):
+        labels = {'view': 'store', 'method': 'GET'}
+        before = REGISTRY.get_sample_value(
+            'bootique_request_latency_seconds_count', labels) or 0
+        self.client.get(reverse('store'))
+        after = REGISTRY.get_sample_value(
+            'bootique_request_latency_seconds_count', labels)
+        self.assertEqual(after, before + 1)
+        self.assertGreater(REGISTRY.get_sample_value(
+            'bootique_db_queries_per_request_sum', {'view': 'store'}), 0)
+
+    async def test_async_requests_are_measured(self):
+        labels = {'view': 'store', 'method': 'GET'}
+        before = REGISTRY.get_sample_value(
+            'bootique_request_latency_seconds_count', labels) or 0
+        queries = REGISTRY.get_sample_value(
+            'bootique_db_queries_per_request_sum', {'view': 'store'}) or 0
+        response = await self.async_client.get(reverse('store'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(REGISTRY.get_sample_value(
+            'bootique_request_latency_seconds_count', labels), before + 1)
+        self.assertGreater(REGISTRY.get_sample_value(
+            'bootique_db_queries_per_request_sum', {'view': 'store'}),
+            queries)
+
+    def test_business_counters(self):
+        before_calls = REGISTRY.get_sample_value(
+            'bootique_add_to_cart_total') or 0
+        before_carts = REGISTRY.get_sample_value(
+            'bootique_carts_created_total') or 0
+        before_sessions = REGISTRY.get_sample_value(
+            'bootique_sessions_created_total') or 0
+        # Business counters are bumped when the view's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.assertEqual(REGISTRY.get_sample_value(
+            'bootique_add_to_cart_total'), before_calls + 1)
+        self.assertEqual(REGISTRY.get_sample_value(
+            'bootique_carts_created_total'), before_carts + 1)
+        self.assertEqual(REGISTRY.get_sample_value(
+            'bootique_sessions_created_total'), before_sessions + 1)
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_recorded_with_plan(self):
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            response = self.client.get(
+                reverse('products_by_category', args=['test-category']))
+        self.assertEqual(response.status_code, 200)
+        query = SlowQuery.objects.filter(
+            view='products_by_category', sql__contains='category_category').first()
+        self.assertIsNotNone(query)
+        self.assertIn('test-category', query.params)
+        self.assertTrue(query.explain)
+        self.assertTrue(query.location.startswith('store/views.py'))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    async def test_slow_queries_are_recorded_under_asgi(self):
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            await self.async_client.get(
+                reverse('products_by_category', args=['test-category']))
+        self.assertTrue(await SlowQuery.objects.filter(
+            view='products_by_category').aexists())
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_stored_outside_the_transaction(self):
+        query_logger = SlowQueryLogger('default')
+        with connection.execute_wrapper(query_logger):
+            with transaction.atomic():
+                Category.objects.count()
+        self.assertFalse(SlowQuery.objects.exists())
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            query_logger.save()
+        self.assertTrue(SlowQuery.objects.filter(
+            sql__contains='category_category').exists())
+        self.assertEqual(query_logger.slow, [])
+
+    def test_fast_queries_are_ignored(self):
+        self.client.get(reverse('store'))
+        self.assertFalse(SlowQuery.objects.exists())
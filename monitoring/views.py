@@ -0,0 +1,27 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from .metrics import render_metrics
+
+# Create your views here.
+
+
+def _authorized(request):
+    token = settings.METRICS_TOKEN
+    if not token:
+        return False
+    if (settings.METRICS_ALLOWED_IPS and request.META.get('REMOTE_ADDR')
+            not in settings.METRICS_ALLOWED_IPS):
+        return False
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(
+        given.encode(), token.encode())
+
+
+def metrics(request):
+    if not _authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -1,5 +1,18 @@
+from datetime import timedelta
+
 from django.contrib import admin
-from .models import Payment, Order, OrderProduct
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from bootique.admin_tools import LargeTableAdmin, ProductFilter
+from category.models import Category
+from store.models import Product
+from .models import (Payment, Order, OrderProduct, OrderExportMark,
+                     OrderNotification, SalesDailyRollup)
+from .export import iter_csv
+from .status import TRANSITIONS, transition
 
 # Register your models here.
 
@@ -8,13 +21,117 @@ class OrderProductInline(admin.TabularInline):
     readonly_fields = ('payment', 'user', 'product', 'quantity', 'product_price', 'ordered')
     extra = 0
 
-class OrderAdmin(admin.ModelAdmin):
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'payment', 'user', 'product')
+
+
+@admin.action(description='Export selected orders as CSV')
+def export_orders_csv(modeladmin, request, queryset):
+    # "Select all" plus the date hierarchy exports a whole date range
+    response = StreamingHttpResponse(
+        iter_csv(queryset.order_by('id')), content_type='text/csv')
+    response['Content-Disposition'] = (
+        'attachment; filename="orders-%s.csv"' %
+        timezone.now().strftime('%Y%m%d-%H%M%S'))
+    return response
+
+
+def transition_action(status):
+    def action(modeladmin, request, queryset):
+        selected = queryset.count()
+        moved = transition(queryset, status)
+        modeladmin.message_user(
+            request, f'{moved} of {selected} orders marked {status}.')
+    action.__name__ = f'mark_{status.lower()}'
+    return admin.action(description=f'Mark selected paid orders {status}')(
+        action)
+
+
+class OrderAdmin(LargeTableAdmin):
     list_display = ['order_number', 'full_name', 'phone', 'email', 'city', 'order_total', 'tax', 'status', 'is_ordered', 'created_at']
-    list_filter = ['status', 'is_ordered']
-    search_fields = ['order_number', 'first_name', 'last_name', 'phone', 'email']
+    list_filter = ['status', 'is_ordered', 'created_at']
+    # Case-sensitive prefix searches (LIKE 'x%') can use the
+    # varchar_pattern_ops indexes Django adds on PostgreSQL for order_number
+    # and email; '^' would search UPPER(column), which no index serves
+    search_fields = ['order_number__startswith', 'email__startswith']
     list_per_page = 20
+    date_hierarchy = 'created_at'
+    actions = [export_orders_csv] + [
+        transition_action(status) for status in TRANSITIONS]
     inlines = [OrderProductInline]
 
-admin.site.register(Payment)
+
+class PaymentAdmin(LargeTableAdmin):
+    list_display = ['payment_id', 'user', 'payment_method', 'amount_paid', 'status', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['^payment_id']
+    autocomplete_fields = ['user']
+
+
+class OrderProductAdmin(LargeTableAdmin):
+    list_display = ['order', 'product', 'quantity', 'product_price', 'ordered', 'created_at']
+    list_select_related = ['order', 'product']
+    list_filter = [ProductFilter, 'ordered']
+    search_fields = ['order__order_number__startswith']
+    autocomplete_fields = ['order', 'payment', 'user', 'product']
+
+
+class SalesDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'dimension', 'key', 'revenue', 'units', 'orders']
+    list_filter = ['dimension']
+    date_hierarchy = 'date'
+    change_list_template = 'admin/orders/salesdailyrollup/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard),
+                 name='orders_salesdailyrollup_dashboard'),
+        ] + super().get_urls()
+
+    def top(self, rollups, dimension, model):
+        rows = list(rollups.filter(dimension=dimension).values('key').annotate(
+            revenue=Sum('revenue'), units=Sum('units'), orders=Sum('orders'),
+        ).order_by('-revenue')[:10])
+        names = model.objects.in_bulk([row['key'] for row in rows])
+        for row in rows:
+            row['name'] = names.get(row['key'], row['key'])
+        return rows
+
+    def dashboard(self, request):
+        # Reads SalesDailyRollup only, never Order or OrderProduct
+        try:
+            days = max(1, int(request.GET.get('days', 30)))
+        except ValueError:
+            days = 30
+        since = timezone.localdate() - timedelta(days=days - 1)
+        rollups = SalesDailyRollup.objects.filter(date__gte=since)
+        daily = rollups.filter(dimension=SalesDailyRollup.DAY).order_by('date')
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Sales dashboard',
+            opts=self.model._meta,
+            days=days,
+            daily=daily,
+            totals=daily.aggregate(revenue=Sum('revenue'), units=Sum('units'),
+                                   orders=Sum('orders')),
+            top_products=self.top(rollups, SalesDailyRollup.PRODUCT, Product),
+            top_categories=self.top(
+                rollups, SalesDailyRollup.CATEGORY, Category),
+        )
+        return TemplateResponse(
+            request, 'admin/orders/sales_dashboard.html', context)
+
+
+admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Order, OrderAdmin)
-admin.site.register(OrderProduct)
+admin.site.register(OrderProduct, OrderProductAdmin)
+admin.site.register(OrderExportMark)
+admin.site.register(OrderNotification)
+admin.site.register(SalesDailyRollup, SalesDailyRollupAdmin)
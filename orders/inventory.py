@@ -0,0 +1,152 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.cache import bump_catalog_version, bump_version
+from store import stock
+from store.models import Product
+from .models import StockReservation
+
+# Stock is held for an order between place_order and payments. Product.stock
+# counts what is still free to reserve: reserving takes quantity with a
+# conditional UPDATE, so concurrent buyers can never drive it below zero,
+# and an expired reservation gives its quantity back when swept. Products
+# flagged is_hot take and give through their stock shards instead.
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(product_id)
+        self.product_id = product_id
+
+
+def _availability_changed(product_id):
+    # Cached product pages only show whether a product is in stock
+    def bump():
+        bump_version('product', product_id)
+        bump_catalog_version()
+    transaction.on_commit(bump)
+
+
+def _is_hot(product_id):
+    return Product.objects.filter(id=product_id, is_hot=True).exists()
+
+
+def take_stock(product_id, quantity):
+    """Take quantity if that much is free; return whether it was taken."""
+    if _is_hot(product_id):
+        taken, sold_out = stock.take(product_id, quantity)
+        if sold_out:
+            _availability_changed(product_id)
+        return taken
+    products = Product.objects.filter(id=product_id)
+    if products.filter(stock=quantity).update(stock=0):
+        _availability_changed(product_id)
+        return True
+    return products.filter(stock__gt=quantity).update(
+        stock=F('stock') - quantity) == 1
+
+
+def give_stock(product_id, quantity):
+    if _is_hot(product_id):
+        if stock.give(product_id, quantity):
+            _availability_changed(product_id)
+        return
+    products = Product.objects.filter(id=product_id)
+    if products.filter(stock=0).update(stock=quantity):
+        _availability_changed(product_id)
+    else:
+        products.update(stock=F('stock') + quantity)
+
+
+def _quantities(items):
+    quantities = Counter()
+    for item in items:
+        quantities[item.product_id] += item.quantity
+    return quantities
+
+
+def _release(reservations):
+    """Delete reservations and give their quantity back.
+
+    Rows are locked first so a concurrent sweep or payment that already
+    handled a reservation does not return its quantity a second time.
+    """
+    quantities = Counter()
+    ids = []
+    for reservation in reservations.select_for_update():
+        quantities[reservation.product_id] += reservation.quantity
+        ids.append(reservation.id)
+    StockReservation.objects.filter(id__in=ids).delete()
+    for product_id, quantity in sorted(quantities.items()):
+        give_stock(product_id, quantity)
+    return quantities
+
+
+def reserve(order, cart_items):
+    """Reserve the cart's quantities for order, or raise OutOfStock.
+
+    Reservations of the user's other unpaid orders are released first, so
+    going back to checkout does not hold stock twice.
+    """
+    expires_at = timezone.now() + timedelta(
+        minutes=settings.RESERVATION_TTL_MINUTES)
+    with transaction.atomic():
+        _release(StockReservation.objects.filter(
+            order__user_id=order.user_id, order__is_ordered=False).exclude(
+            order=order))
+        reservations = []
+        # A fixed product order keeps concurrent buyers from deadlocking
+        for product_id, quantity in sorted(_quantities(cart_items).items()):
+            if not take_stock(product_id, quantity):
+                raise OutOfStock(product_id)
+            reservations.append(StockReservation(
+                order=order, product_id=product_id, quantity=quantity,
+                expires_at=expires_at))
+        StockReservation.objects.bulk_create(reservations)
+
+
+def convert(order, cart_items):
+    """Turn the order's reservations into sales of the paid quantities.
+
+    Differences from the reserved quantities are taken or given back. A
+    reservation swept before the payment arrived is taken again if the
+    stock is still there; otherwise the sale is logged as oversold, since
+    the money has already been captured.
+    """
+    sold = _quantities(cart_items)
+    reserved = Counter()
+    reservations = StockReservation.objects.filter(order=order)
+    for reservation in reservations.select_for_update():
+        reserved[reservation.product_id] += reservation.quantity
+    reservations.delete()
+    for product_id in sorted(set(sold) | set(reserved)):
+        difference = sold[product_id] - reserved[product_id]
+        if difference < 0:
+            give_stock(product_id, -difference)
+        elif difference > 0 and not take_stock(product_id, difference):
+            logger.warning('Order %s oversold product %s by %s',
+                           order.order_number, product_id, difference)
+
+
+def sweep(batch_size=500, now=None):
+    """Release expired reservations in batches; return the count."""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        ids = list(StockReservation.objects.filter(
+            expires_at__lte=now).order_by('id').values_list(
+            'id', flat=True)[:batch_size])
+        if not ids:
+            return released
+        with transaction.atomic():
+            _release(StockReservation.objects.filter(
+                id__in=ids, expires_at__lte=now))
+        released += len(ids)
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from orders.rollups import history_range, rebuild
+
+
+class Command(BaseCommand):
+    help = ('Recompute SalesDailyRollup from paid order lines, one '
+            'transaction per range of days.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from',
+                            help='First day, YYYY-MM-DD; defaults to the '
+                                 'first sale')
+        parser.add_argument('--to', dest='date_to',
+                            help='Last day, YYYY-MM-DD; defaults to the last '
+                                 'sale')
+        parser.add_argument('--days', type=int, default=31,
+                            help='Days per range')
+
+    def handle(self, *args, **options):
+        history = history_range()
+        if history is None:
+            self.stdout.write('No paid orders to roll up.')
+            return
+        bounds = []
+        for option, default in zip(('date_from', 'date_to'), history):
+            value = options[option]
+            if value and parse_date(value) is None:
+                raise CommandError(f'Invalid date: {value}')
+            bounds.append(parse_date(value) if value else default)
+
+        start, end = bounds
+        rows = 0
+        while start <= end:
+            stop = min(start + timedelta(days=options['days'] - 1), end)
+            rows += rebuild(start, stop)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{start} - {stop}')
+            start = stop + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {rows} rollup rows for {bounds[0]} - {bounds[1]}'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.inventory import sweep
+
+
+class Command(BaseCommand):
+    help = ('Give the stock of expired reservations back, in batches. Run '
+            'it every minute or so from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Reservations per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        released = sweep(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Released {released} expired reservations in '
+            f'{time.monotonic() - started:.1f}s'))
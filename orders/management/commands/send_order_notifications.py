@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.status import send_notifications
+
+
+class Command(BaseCommand):
+    help = ('Send the queued order status emails in batches. Run it every '
+            'minute or so from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Emails per SMTP connection')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        sent = send_notifications(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {sent} order notifications in '
+            f'{time.monotonic() - started:.1f}s'))
@@ -0,0 +1,161 @@
+import json
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account
+from category.models import Category
+from carts.models import CartItem
+from orders import rollups
+from orders.models import Order, StockReservation
+from store.models import Product
+from store.stock import available, set_stock
+
+BILLING = {
+    'first_name': 'Load', 'last_name': 'Test', 'phone': '123456789',
+    'email': 'load@example.com', 'address_line_1': '1 Test St',
+    'address_line_2': '', 'country': 'UA', 'state': 'Kyiv', 'city': 'Kyiv',
+    'order_note': '',
+}
+
+
+def _checkout(client, user, product):
+    client.get(reverse('add_to_cart', args=[product.id]))
+    client.get(reverse('add_to_cart', args=[product.id]))
+    response = client.post(reverse('place_order'), BILLING)
+    if response.status_code == 302 and response.url == reverse('cart'):
+        # Sold out: the reservation was refused
+        CartItem.objects.filter(user=user).delete()
+        return 'sold out'
+    if response.status_code != 200:
+        return f'place_order returned {response.status_code}'
+    order = Order.objects.filter(user=user, is_ordered=False).latest('id')
+    response = client.post(reverse('payments'), json.dumps({
+        'orderID': order.order_number,
+        'transID': f'stress-{order.id}',
+        'payment_method': 'PayPal',
+        'status': 'COMPLETED',
+    }), content_type='application/json')
+    if response.status_code != 200:
+        return f'payments returned {response.status_code}'
+    return 'paid'
+
+
+def _worker(args):
+    user_id, product_id, iterations = args
+    completed, sold_out, errors = 0, 0, []
+    with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+        user = Account.objects.get(id=user_id)
+        product = Product.objects.get(id=product_id)
+        client = Client()
+        client.force_login(user)
+        for i in range(iterations):
+            try:
+                result = _checkout(client, user, product)
+                if result == 'paid':
+                    completed += 1
+                elif result == 'sold out':
+                    sold_out += 1
+                else:
+                    errors.append(result)
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+    connections.close_all()
+    return completed, sold_out, errors
+
+
+class Command(BaseCommand):
+    help = ('Run add_to_cart, place_order and payments from several '
+            'processes at once against the configured database. The '
+            'unlisted product, the buyers and their orders are deleted '
+            'afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=10,
+                            help='Checkouts per process')
+        parser.add_argument('--stock', type=int, default=100000,
+                            help='Stock of the single product every process '
+                                 'buys; set it below 2 * processes * '
+                                 'iterations to simulate a flash sale')
+        parser.add_argument('--hot', action='store_true',
+                            help='Flag the product hot so its stock is '
+                                 'sharded')
+
+    def handle(self, *args, **options):
+        started_on = timezone.localdate()
+        category, category_created = Category.objects.get_or_create(
+            slug='stress-test', defaults={'category_name': 'Stress test'})
+        # Not available, so it never shows in the catalog meanwhile
+        product = Product.objects.create(
+            product_name=f'Stress product {time.time()}',
+            slug=f'stress-product-{time.time_ns()}',
+            price=10, stock=options['stock'], category=category,
+            images='photos/products/stress.jpg', is_hot=options['hot'],
+            is_available=False)
+        users = []
+        try:
+            if product.is_hot:
+                set_stock(product.id, product.stock)
+            for i in range(options['processes']):
+                # No password: the buyers are only logged in by the workers
+                user = Account.objects.create_user(
+                    first_name='Load', last_name='Test',
+                    username=f'stress{time.time_ns()}{i}',
+                    email=f'stress{time.time_ns()}{i}@example.com')
+                user.is_active = True
+                user.save()
+                users.append(user)
+            self.run(product, users, options)
+        finally:
+            connections.close_all()
+            Order.objects.filter(user__in=users).delete()
+            product.delete()
+            for user in users:
+                user.delete()
+            if category_created:
+                category.delete()
+            # Take the stress orders back out of the sales rollups
+            rollups.rebuild(started_on, timezone.localdate())
+
+    def run(self, product, users, options):
+        # Children must open their own connections
+        connections.close_all()
+        started = time.monotonic()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(len(users)) as pool:
+            results = pool.map(_worker, [
+                (user.id, product.id, options['iterations']) for user in users])
+        elapsed = time.monotonic() - started
+
+        completed = sum(result[0] for result in results)
+        sold_out = sum(result[1] for result in results)
+        errors = [error for result in results for error in result[2]]
+        product.refresh_from_db()
+        left = available(product)
+        sold = options['stock'] - left
+        orders = Order.objects.filter(user__in=users, is_ordered=True).count()
+
+        self.stdout.write(
+            f'{completed} checkouts in {elapsed:.1f}s '
+            f'({completed / elapsed:.1f}/s), {sold_out} sold out, '
+            f'{len(errors)} errors, {orders} paid orders, {sold} units sold, '
+            f'{left} left')
+        for error in errors[:10]:
+            self.stdout.write(f'  {error}')
+        if errors:
+            raise CommandError(f'{len(errors)} checkouts failed')
+        if sold != 2 * completed or orders != completed:
+            raise CommandError('Stock or orders do not match the checkouts')
+        if StockReservation.objects.filter(product=product).exists():
+            raise CommandError('Reservations were left behind')
+        if sold_out and left >= 2:
+            raise CommandError('Checkouts were refused with stock left')
+        self.stdout.write(self.style.SUCCESS('No errors, stock consistent'))
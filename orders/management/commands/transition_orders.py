@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from orders.export import filter_orders
+from orders.models import Order
+from orders.status import TRANSITIONS, transition
+
+
+class Command(BaseCommand):
+    help = ('Move paid orders to a new status in bulk. Only orders in a '
+            'status the new one may follow are changed; their customers '
+            'are queued an email for send_order_notifications.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('status', choices=sorted(TRANSITIONS))
+        parser.add_argument('--from', dest='date_from',
+                            help='First creation date, YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to',
+                            help='Last creation date, YYYY-MM-DD')
+        parser.add_argument('--order', action='append', default=[],
+                            dest='order_numbers', metavar='ORDER_NUMBER',
+                            help='Only this order; may be repeated')
+        parser.add_argument('--no-notify', action='store_true',
+                            help='Do not email the customers')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Orders per UPDATE')
+
+    def handle(self, *args, **options):
+        dates = {}
+        for option in ('date_from', 'date_to'):
+            if options[option]:
+                dates[option] = parse_date(options[option])
+                if dates[option] is None:
+                    raise CommandError(f'Invalid date: {options[option]}')
+
+        orders = filter_orders(Order.objects.all(), **dates)
+        if options['order_numbers']:
+            orders = orders.filter(order_number__in=options['order_numbers'])
+        started = time.monotonic()
+        moved = transition(
+            orders, options['status'], notify=not options['no_notify'],
+            batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} orders to {options["status"]} in '
+            f'{time.monotonic() - started:.1f}s'))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-19 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_export_mark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dimension', models.CharField(choices=[('day', 'Day'), ('product', 'Product'), ('category', 'Category')], max_length=10)),
+                ('key', models.PositiveIntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='salesdailyrollup',
+            index=models.Index(fields=['dimension', 'date'], name='orders_sale_dimensi_b1ca91_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='salesdailyrollup',
+            unique_together={('date', 'dimension', 'key')},
+        ),
+    ]
@@ -29,11 +29,11 @@ class Order(models.Model):
     user = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True)
     payment = models.ForeignKey(
         Payment, on_delete=models.SET_NULL, blank=True, null=True)
-    order_number = models.CharField(max_length=20)
+    order_number = models.CharField(max_length=20, unique=True)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     phone = models.CharField(max_length=15)
-    email = models.EmailField(max_length=50)
+    email = models.EmailField(max_length=50, db_index=True)
     address_line_1 = models.CharField(max_length=50)
     address_line_2 = models.CharField(max_length=50, blank=True)
     country = models.CharField(max_length=50)
@@ -45,8 +45,8 @@ class Order(models.Model):
     status = models.CharField(max_length=10, choices=STATUS, default='New')
     ip = models.CharField(blank=True, max_length=20)
     is_ordered = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def full_name(self):
         return f'{self.first_name} {self.last_name}'
@@ -73,3 +73,102 @@ class OrderProduct(models.Model):
 
     def __str__(self):
         return self.product.product_name
+
+
+class OrderNumberSequence(models.Model):
+    # Last order number handed out for a day (orders.numbers)
+    date = models.DateField(unique=True)
+    last = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.date} {self.last}'
+
+
+class OrderExportMark(models.Model):
+    # High-water mark of an incremental order export (orders.export)
+    name = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    order_id = models.PositiveIntegerField(default=0)
+    exported_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class SalesDailyRollup(models.Model):
+    # Paid sales per day, kept up to date by orders.rollups so reports do
+    # not scan Order and OrderProduct. key is the product or category id,
+    # and 0 for the whole-day totals.
+    DAY = 'day'
+    PRODUCT = 'product'
+    CATEGORY = 'category'
+    DIMENSIONS = (
+        (DAY, 'Day'),
+        (PRODUCT, 'Product'),
+        (CATEGORY, 'Category'),
+    )
+
+    date = models.DateField()
+    dimension = models.CharField(max_length=10, choices=DIMENSIONS)
+    key = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'dimension', 'key')
+        indexes = [models.Index(fields=['dimension', 'date'])]
+
+    def __str__(self):
+        return f'{self.date} {self.dimension} {self.key}'
+
+
+class StockReservation(models.Model):
+    # Quantity held for an unpaid order until expires_at (orders.inventory)
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.order_id} {self.product_id} x{self.quantity}'
+
+
+class PaymentIdempotencyKey(models.Model):
+    # Response of a processed payment callback, replayed when the client
+    # retries it (orders.views.payments)
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(Account, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
+class OrderReceipt(models.Model):
+    # What order_complete and order_detail show for a paid order, written
+    # once by orders.receipts since a paid order does not change
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, related_name='receipt')
+    order_number = models.CharField(max_length=20, unique=True)
+    user = models.ForeignKey(Account, on_delete=models.CASCADE)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.order_number
+
+
+class OrderNotification(models.Model):
+    # Status email waiting to be sent by send_order_notifications
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.order_id} {self.status}'
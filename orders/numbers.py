@@ -0,0 +1,51 @@
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OrderNumberSequence
+
+# Order numbers are the date followed by a six digit counter of the day,
+# e.g. 20240131000042. Each process takes ORDER_NUMBER_BLOCK numbers at a
+# time from the day's OrderNumberSequence row, so app nodes never hand out
+# the same number and only one order in a block waits on the row lock. A
+# block is kept for later orders only once the transaction that took it
+# has committed; numbers left in a block when a process exits are skipped.
+
+_lock = threading.Lock()
+_block = {'date': None, 'next': 0, 'end': 0}
+
+
+def _format(date, number):
+    return f'{date:%Y%m%d}{number:06d}'
+
+
+def _take_block(date):
+    size = settings.ORDER_NUMBER_BLOCK
+    OrderNumberSequence.objects.get_or_create(date=date)
+    OrderNumberSequence.objects.filter(date=date).update(
+        last=F('last') + size)
+    end = OrderNumberSequence.objects.values_list('last', flat=True).get(
+        date=date) + 1
+    return end - size, end
+
+
+def next_order_number():
+    """Allocate an order number before the order is inserted."""
+    date = timezone.localdate()
+    with _lock:
+        if _block['date'] == date and _block['next'] < _block['end']:
+            number = _block['next']
+            _block['next'] += 1
+            return _format(date, number)
+
+    with transaction.atomic():
+        start, end = _take_block(date)
+
+    def keep():
+        with _lock:
+            _block.update(date=date, next=start + 1, end=end)
+    transaction.on_commit(keep)
+    return _format(date, start)
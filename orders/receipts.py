@@ -0,0 +1,69 @@
+from django.utils.dateparse import parse_datetime
+
+from .models import Order, OrderProduct, OrderReceipt
+
+# A paid order's receipt is snapshotted once, when payments() completes,
+# so showing it later is one lookup on (order_number, user) instead of
+# re-reading the order, its payment and every line with its product.
+# Orders paid before snapshots existed get theirs on first view.
+
+
+def build(order):
+    lines = []
+    subtotal = 0
+    for line in OrderProduct.objects.filter(order=order).select_related(
+            'product').prefetch_related('variations').order_by('id'):
+        subtotal += line.product_price * line.quantity
+        lines.append({
+            'product_name': line.product.product_name,
+            'variations': [
+                [variation.variation_category, variation.variation_value]
+                for variation in line.variations.all()],
+            'quantity': line.quantity,
+            'product_price': line.product_price,
+        })
+    payment = order.payment
+    return {
+        'order': {
+            'order_number': order.order_number,
+            'full_name': order.full_name(),
+            'full_address': order.full_address(),
+            'city': order.city,
+            'state': order.state,
+            'country': order.country,
+            'created_at': order.created_at.isoformat(),
+            'tax': order.tax,
+            'order_total': order.order_total,
+        },
+        'payment': {
+            'payment_id': payment.payment_id if payment else '',
+            'status': payment.status if payment else '',
+        },
+        'lines': lines,
+        'subtotal': subtotal,
+    }
+
+
+def snapshot(order):
+    data = build(order)
+    OrderReceipt.objects.update_or_create(
+        order=order, defaults={
+            'order_number': order.order_number, 'user_id': order.user_id,
+            'data': data})
+    return data
+
+
+def for_user(order_number, user):
+    """The receipt of one of user's paid orders, or None."""
+    data = OrderReceipt.objects.filter(
+        order_number=order_number, user=user).values_list(
+        'data', flat=True).first()
+    if data is None:
+        order = Order.objects.filter(
+            order_number=order_number, user=user,
+            is_ordered=True).select_related('payment').first()
+        if order is None:
+            return None
+        data = snapshot(order)
+    data['order']['created_at'] = parse_datetime(data['order']['created_at'])
+    return data
@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from .models import OrderProduct, SalesDailyRollup
+
+# Paid order lines are rolled up per day, per product and per category.
+# record_order() adds one order as it is paid; rebuild() recomputes a date
+# range from OrderProduct. Both date a line by its created_at, which is
+# when payments() moved it out of the cart. record_customer() keeps the
+# order summary on the buyer's UserProfile.
+
+DIMENSIONS = (
+    (SalesDailyRollup.DAY, None),
+    (SalesDailyRollup.PRODUCT, 'product_id'),
+    (SalesDailyRollup.CATEGORY, 'product__category_id'),
+)
+
+
+def _paid_lines():
+    return OrderProduct.objects.filter(ordered=True)
+
+
+def record_order(order):
+    """Add a freshly paid order to the rollups of the day it was paid."""
+    lines = list(_paid_lines().filter(order=order).values(
+        'product_id', 'product__category_id', 'quantity', 'product_price',
+        'created_at'))
+    if not lines:
+        return
+    date = timezone.localdate(lines[0]['created_at'])
+
+    deltas = {}
+    for line in lines:
+        revenue = line['quantity'] * line['product_price']
+        for dimension, field in DIMENSIONS:
+            key = line[field] if field else 0
+            delta = deltas.setdefault((dimension, key), [0, 0])
+            delta[0] += revenue
+            delta[1] += line['quantity']
+
+    for (dimension, key), (revenue, units) in deltas.items():
+        rollup, created = SalesDailyRollup.objects.get_or_create(
+            date=date, dimension=dimension, key=key)
+        # The order counts once per product and category it contains
+        SalesDailyRollup.objects.filter(pk=rollup.pk).update(
+            revenue=F('revenue') + revenue,
+            units=F('units') + units,
+            orders=F('orders') + 1)
+
+
+def record_customer(order):
+    """Add a freshly paid order to its buyer's summary."""
+    profile, created = UserProfile.objects.get_or_create(user_id=order.user_id)
+    UserProfile.objects.filter(pk=profile.pk).update(
+        order_count=F('order_count') + 1,
+        lifetime_spend=F('lifetime_spend') + order.order_total,
+        last_order_number=order.order_number,
+        last_order_at=order.created_at)
+
+
+def _grouped(date_from, date_to, field):
+    lines = _paid_lines().annotate(day=TruncDate('created_at')).filter(
+        day__gte=date_from, day__lte=date_to)
+    group = ['day', field] if field else ['day']
+    return lines.values(*group).annotate(
+        total_revenue=Sum(F('quantity') * F('product_price'),
+                          output_field=FloatField()),
+        total_units=Sum('quantity'),
+        total_orders=Count('order', distinct=True),
+    ).order_by()
+
+
+@transaction.atomic
+def rebuild(date_from, date_to):
+    """Recompute the rollups of date_from..date_to, one grouped query per
+    dimension, and return the number of rows written."""
+    rollups = []
+    for dimension, field in DIMENSIONS:
+        for row in _grouped(date_from, date_to, field):
+            rollups.append(SalesDailyRollup(
+                date=row['day'], dimension=dimension,
+                key=row[field] if field else 0,
+                revenue=row['total_revenue'], units=row['total_units'],
+                orders=row['total_orders']))
+    SalesDailyRollup.objects.filter(
+        date__gte=date_from, date__lte=date_to).delete()
+    SalesDailyRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def history_range():
+    """First and last day with paid lines, or None when there are none."""
+    dates = _paid_lines().aggregate(
+        first=Min('created_at'), last=Max('created_at'))
+    if dates['first'] is None:
+        return None
+    return (timezone.localdate(dates['first']),
+            timezone.localdate(dates['last']))
@@ -0,0 +1,79 @@
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Order, OrderNotification
+
+# Bulk status changes of paid orders. Each batch is one conditional UPDATE
+# whose WHERE clause only matches orders in a status the target may be
+# reached from, so an order is never moved backwards or twice. The
+# customer emails are queued as OrderNotification rows in the same
+# transaction and sent in batches by the send_order_notifications command.
+
+TRANSITIONS = {
+    'Accepted': ('New',),
+    'Completed': ('Accepted',),
+    'Cancelled': ('New', 'Accepted'),
+}
+
+
+def transition(orders, status, notify=True, batch_size=500):
+    """Move the paid orders among ``orders`` that may reach ``status`` to
+    it; return how many moved."""
+    if status not in TRANSITIONS:
+        raise ValueError(f'Orders cannot be moved to {status}')
+    movable = orders.filter(
+        is_ordered=True, status__in=TRANSITIONS[status]).order_by('id')
+    moved = 0
+    last = 0
+    while True:
+        with transaction.atomic():
+            batch = list(movable.select_for_update().filter(
+                id__gt=last).values_list('id', flat=True)[:batch_size])
+            if not batch:
+                return moved
+            now = timezone.now()
+            count = Order.objects.filter(
+                id__in=batch, status__in=TRANSITIONS[status]).update(
+                status=status, updated_at=now)
+            ids = batch
+            if count < len(batch):
+                # Some changed status between the SELECT and the UPDATE
+                ids = list(Order.objects.filter(
+                    id__in=batch, status=status, updated_at=now).values_list(
+                    'id', flat=True))
+            if notify:
+                OrderNotification.objects.bulk_create([
+                    OrderNotification(order_id=order_id, status=status)
+                    for order_id in ids])
+        moved += count
+        last = batch[-1]
+
+
+def send_notifications(batch_size=100):
+    """Send queued status emails over one connection per batch; return
+    how many were sent."""
+    sent = 0
+    connection = get_connection()
+    while True:
+        notifications = list(OrderNotification.objects.filter(
+            sent_at__isnull=True).select_related('order').order_by(
+            'id')[:batch_size])
+        if not notifications:
+            return sent
+        messages = [
+            EmailMessage(
+                f'Your order {notification.order.order_number} is '
+                f'{notification.status.lower()}',
+                render_to_string('orders/order_status_email.html', {
+                    'order': notification.order,
+                    'status': notification.status,
+                }),
+                to=[notification.order.email], connection=connection)
+            for notification in notifications]
+        connection.send_messages(messages)
+        OrderNotification.objects.filter(
+            id__in=[notification.id for notification in notifications]
+        ).update(sent_at=timezone.now())
+        sent += len(notifications)
@@ -1,9 +1,32 @@
-from django.test import TestCase, Client
-from .models import Payment, Order, OrderProduct
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from contextlib import closing
+from datetime import datetime, timedelta
+from io import StringIO
+from django.conf import settings
+from django.core import mail
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from .models import (Payment, Order, OrderProduct, SalesDailyRollup,
+                     StockReservation, PaymentIdempotencyKey,
+                     OrderNumberSequence, OrderReceipt, OrderNotification)
+from .export import filter_orders
+from .status import transition
+from . import numbers
+from .inventory import sweep
 from store.models import Product
+from store.stock import available, rebalance, set_stock
 from carts.models import CartItem
 from accounts.models import Account
 from django.urls import reverse
+from django.core.management import call_command
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from category.models import Category
 
 # Create your tests here.
 
@@ -201,7 +224,7 @@ class TestPlaceOrder(TestCase):
         self.assertEqual(order.tax, (2 * self.cart_item.product.price)/100)
         self.assertEqual(order.ip, '127.0.0.1')
         self.assertEqual(order.order_number,
-                         order.created_at.strftime('%Y%m%d') + str(order.id))
+                         timezone.localdate().strftime('%Y%m%d') + '000001')
 
 
 class TestOrderComplete(TestCase):
@@ -286,3 +309,563 @@ class TestOrderComplete(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse(
             'login') + '?next=' + reverse('order_complete') + '?order_number=202305091&#payment_id=123')
+
+
+class SQLiteProductionModeConcurrencyTest(SimpleTestCase):
+    """Checkouts from several processes against a real SQLite file."""
+
+    def manage(self, *args):
+        return subprocess.run(
+            [sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR,
+            env=self.env, capture_output=True, text=True, timeout=300)
+
+    def test_concurrent_checkouts_do_not_lock(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        log_file = os.path.join(directory.name, 'slow_queries.log')
+        self.env = dict(
+            os.environ,
+            SQLITE_PATH=os.path.join(directory.name, 'db.sqlite3'),
+            SQLITE_PRODUCTION_MODE='True',
+            SLOW_QUERY_LOG_FILE=log_file,
+        )
+        migrate = self.manage('migrate', '-v', '0')
+        self.assertEqual(migrate.returncode, 0, migrate.stderr)
+        stress = self.manage(
+            'stress_checkout', '--processes', '4', '--iterations', '5')
+        self.assertEqual(stress.returncode, 0, stress.stdout + stress.stderr)
+        self.assertIn('20 checkouts', stress.stdout)
+        self.assertIn('0 errors', stress.stdout)
+
+        # Flash sale: 40 buyers of 2 units each for 9 units
+        stress = self.manage(
+            'stress_checkout', '--processes', '4', '--iterations', '10',
+            '--stock', '9')
+        self.assertEqual(stress.returncode, 0, stress.stdout + stress.stderr)
+        self.assertIn('4 checkouts', stress.stdout)
+        self.assertIn('36 sold out', stress.stdout)
+        self.assertIn('1 left', stress.stdout)
+
+        # The same sale on a hot product with sharded stock
+        stress = self.manage(
+            'stress_checkout', '--processes', '4', '--iterations', '10',
+            '--stock', '9', '--hot')
+        self.assertEqual(stress.returncode, 0, stress.stdout + stress.stderr)
+        self.assertIn('4 checkouts', stress.stdout)
+        self.assertIn('1 left', stress.stdout)
+
+        # The fixtures are gone and the catalog never listed the product
+        with closing(sqlite3.connect(self.env['SQLITE_PATH'])) as db:
+            for table in ('store_product', 'accounts_account',
+                          'orders_order', 'orders_payment',
+                          'orders_salesdailyrollup'):
+                count, = db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()
+                self.assertEqual(count, 0, table)
+
+        # Lock waits are logged as slow queries without failing to store
+        if os.path.exists(log_file):
+            with open(log_file) as f:
+                self.assertNotIn('Traceback', f.read())
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_superuser(
+            first_name='Admin', last_name='User', username='admin',
+            email='admin@example.com', password='password')
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=10, category=category, images='photos/products/test.jpg')
+        self.paid = self.create_order('1001', paid=True)
+        self.open = self.create_order('1002', paid=False)
+
+    def create_order(self, number, paid):
+        payment = None
+        if paid:
+            payment = Payment.objects.create(
+                user=self.user, payment_id='PAY' + number,
+                payment_method='PayPal', amount_paid='120', status='COMPLETED')
+        order = Order.objects.create(
+            user=self.user, payment=payment, order_number=number,
+            first_name='John', last_name='Doe', phone='123',
+            email='john@example.com', address_line_1='1 Street',
+            country='UA', state='Kyiv', city='Kyiv', order_total=120,
+            tax=20, is_ordered=paid)
+        if paid:
+            OrderProduct.objects.create(
+                order=order, payment=payment, user=self.user,
+                product=self.product, quantity=2, product_price=50,
+                ordered=True)
+        self.age(order)
+        return order
+
+    def age(self, order, minutes=5):
+        # Incremental exports leave the last minute for the next run
+        Order.objects.filter(pk=order.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=minutes))
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_orders', *args, stdout=out, stderr=StringIO())
+        return out.getvalue().splitlines()
+
+    def test_export_rows(self):
+        lines = self.export()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('order_id,order_number'))
+        self.assertIn('PAY1001', lines[1])
+        self.assertTrue(lines[1].endswith('Test product,2,50.0,100.0'))
+        self.assertTrue(lines[2].endswith(',,,,,'))
+
+    def test_filters(self):
+        self.assertEqual(len(self.export('--paid-only')), 2)
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        self.assertEqual(len(self.export('--from', tomorrow)), 1)
+        self.assertEqual(len(self.export('--to', tomorrow)), 3)
+
+    def test_date_filters_are_ranges_on_created_at(self):
+        today = timezone.localdate()
+        Order.objects.filter(pk=self.open.pk).update(
+            created_at=timezone.make_aware(datetime.combine(
+                today, datetime.max.time())))
+        orders = filter_orders(Order.objects.all(), today, today)
+        self.assertEqual(orders.count(), 2)
+        self.assertNotIn('django_datetime_cast_date', str(orders.query))
+        self.assertFalse(filter_orders(
+            Order.objects.all(), date_to=today - timedelta(days=1)).exists())
+
+    def test_incremental_export_reads_only_new_rows(self):
+        self.assertEqual(len(self.export('--incremental', 'nightly')), 3)
+        self.assertEqual(len(self.export('--incremental', 'nightly')), 1)
+        self.open.is_ordered = True
+        self.open.save()
+        self.age(self.open, minutes=2)
+        lines = self.export('--incremental', 'nightly')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('1002', lines[1])
+        self.assertEqual(len(self.export('--incremental', 'nightly')), 1)
+
+    def test_admin_action_streams_csv(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.post(reverse('admin:orders_order_changelist'), {
+            'action': 'export_orders_csv',
+            '_selected_action': [self.paid.pk, self.open.pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), 3)
+
+
+class SalesDailyRollupTest(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_superuser(
+            first_name='Admin', last_name='User', username='admin',
+            email='admin@example.com', password='password')
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=10, category=self.category,
+            images='photos/products/test.jpg')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def checkout(self, quantity):
+        for i in range(quantity):
+            self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.client.post(reverse('place_order'), {
+            'first_name': 'John', 'last_name': 'Doe', 'phone': '123',
+            'email': 'john@example.com', 'address_line_1': '1 Street',
+            'address_line_2': '', 'country': 'UA', 'state': 'Kyiv',
+            'city': 'Kyiv', 'order_note': ''})
+        order = Order.objects.filter(is_ordered=False).latest('id')
+        self.client.post(reverse('payments'), json.dumps({
+            'orderID': order.order_number, 'transID': 'T%d' % order.id,
+            'payment_method': 'PayPal', 'status': 'COMPLETED',
+        }), content_type='application/json')
+
+    def rollups(self):
+        return sorted(SalesDailyRollup.objects.values_list(
+            'dimension', 'key', 'revenue', 'units', 'orders'))
+
+    def test_payment_updates_rollups(self):
+        self.checkout(2)
+        self.checkout(1)
+        self.assertEqual(self.rollups(), [
+            ('category', self.category.id, 150.0, 3, 2),
+            ('day', 0, 150.0, 3, 2),
+            ('product', self.product.id, 150.0, 3, 2),
+        ])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.checkout(2)
+        self.checkout(1)
+        incremental = self.rollups()
+        SalesDailyRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_sales_rollups', stdout=out)
+        self.assertIn('Wrote 3 rollup rows', out.getvalue())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_dashboard_reads_only_rollups(self):
+        self.checkout(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:orders_salesdailyrollup_dashboard'))
+        self.assertContains(response, 'Test product')
+        self.assertContains(response, '100.00')
+        for query in queries:
+            self.assertNotIn('"orders_order', query['sql'])
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='john@example.com', password='password')
+        self.user.is_active = True
+        self.user.save()
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=3, category=category, images='photos/products/test.jpg')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def place_order(self, quantity):
+        for i in range(quantity):
+            self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        return self.client.post(reverse('place_order'), {
+            'first_name': 'John', 'last_name': 'Doe', 'phone': '123',
+            'email': 'john@example.com', 'address_line_1': '1 Street',
+            'address_line_2': '', 'country': 'UA', 'state': 'Kyiv',
+            'city': 'Kyiv', 'order_note': ''})
+
+    def pay(self):
+        order = Order.objects.get(is_ordered=False)
+        return self.client.post(reverse('payments'), json.dumps({
+            'orderID': order.order_number, 'transID': 'T1',
+            'payment_method': 'PayPal', 'status': 'COMPLETED',
+        }), content_type='application/json')
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def test_place_order_reserves_and_payment_converts(self):
+        self.place_order(2)
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+        self.pay()
+        self.assertEqual(self.stock(), 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_placing_again_replaces_the_reservation(self):
+        self.place_order(2)
+        self.place_order(0)
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_out_of_stock(self):
+        response = self.place_order(4)
+        self.assertRedirects(response, reverse('cart'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(Order.objects.exists())
+        response = self.client.get(reverse('cart'))
+        self.assertContains(response, 'not enough Test product in stock')
+
+    def test_sweeper_releases_expired_reservations(self):
+        self.place_order(2)
+        self.assertEqual(sweep(), 0)
+        self.assertEqual(sweep(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(self.stock(), 3)
+        # A late payment takes the stock again
+        self.pay()
+        self.assertEqual(self.stock(), 1)
+
+    def test_sweeper_command(self):
+        self.place_order(1)
+        StockReservation.objects.update(
+            expires_at=timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Released 1 expired reservations', out.getvalue())
+        self.assertEqual(self.stock(), 3)
+
+    def test_hot_product_reserves_from_shards(self):
+        self.product.is_hot = True
+        self.product.save()
+        set_stock(self.product.id, 3)
+        self.place_order(2)
+        self.assertEqual(available(self.product), 1)
+        self.pay()
+        self.assertEqual(available(self.product), 1)
+        response = self.place_order(2)
+        self.assertRedirects(response, reverse('cart'),
+                             fetch_redirect_response=False)
+        self.assertEqual(available(self.product), 1)
+        # The displayed stock catches up when the shards are rebalanced
+        rebalance(self.product.id)
+        self.assertEqual(self.stock(), 1)
+
+
+class PaymentIdempotencyTest(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='john@example.com', password='password')
+        self.user.is_active = True
+        self.user.save()
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=5, category=category, images='photos/products/test.jpg')
+        self.client = Client()
+        self.client.force_login(self.user)
+        for i in range(2):
+            self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.client.post(reverse('place_order'), {
+            'first_name': 'John', 'last_name': 'Doe', 'phone': '123',
+            'email': 'john@example.com', 'address_line_1': '1 Street',
+            'address_line_2': '', 'country': 'UA', 'state': 'Kyiv',
+            'city': 'Kyiv', 'order_note': ''})
+        self.order = Order.objects.get()
+
+    def pay(self, trans_id='T1'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('payments'), json.dumps({
+                'orderID': self.order.order_number, 'transID': trans_id,
+                'payment_method': 'PayPal', 'status': 'COMPLETED',
+            }), content_type='application/json')
+
+    def test_retried_callback_replays_the_response(self):
+        first = self.pay()
+        self.assertEqual(first.status_code, 200)
+        second = self.pay()
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(OrderProduct.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(PaymentIdempotencyKey.objects.get().order,
+                         self.order)
+
+    def test_second_payment_of_a_paid_order_is_refused(self):
+        self.pay()
+        response = self.pay('T2')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_unknown_order(self):
+        self.order.order_number = 'missing'
+        self.assertEqual(self.pay().status_code, 404)
+
+
+@override_settings(ORDER_NUMBER_BLOCK=3)
+class OrderNumberTest(TestCase):
+    def setUp(self):
+        numbers._block.update(date=None, next=0, end=0)
+
+    def test_numbers_come_in_blocks_of_the_day(self):
+        today = timezone.localdate().strftime('%Y%m%d')
+        with self.captureOnCommitCallbacks(execute=True):
+            first = numbers.next_order_number()
+        with CaptureQueriesContext(connection) as queries:
+            rest = [numbers.next_order_number() for i in range(2)]
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([first] + rest, [
+            today + '000001', today + '000002', today + '000003'])
+        self.assertEqual(numbers.next_order_number(), today + '000004')
+        self.assertEqual(OrderNumberSequence.objects.get().last, 6)
+
+    def test_uncommitted_block_is_not_reused(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            first = numbers.next_order_number()
+        self.assertNotEqual(numbers.next_order_number(), first)
+
+    def test_place_order_inserts_once(self):
+        user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='john@example.com', password='password')
+        user.is_active = True
+        user.save()
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=5, category=category, images='photos/products/test.jpg')
+        client = Client()
+        client.force_login(user)
+        client.get(reverse('add_to_cart', args=[product.id]))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(reverse('place_order'), {
+                'first_name': 'John', 'last_name': 'Doe', 'phone': '123',
+                'email': 'john@example.com', 'address_line_1': '1 Street',
+                'address_line_2': '', 'country': 'UA', 'state': 'Kyiv',
+                'city': 'Kyiv', 'order_note': ''})
+        order = Order.objects.get()
+        self.assertContains(response, order.order_number)
+        writes = [query['sql'] for query in queries
+                  if 'orders_order"' in query['sql'].split(' WHERE ')[0]
+                  and query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 1)
+
+
+class OrderReceiptTest(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='john@example.com', password='password')
+        self.user.is_active = True
+        self.user.save()
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=50,
+            stock=5, category=category, images='photos/products/test.jpg')
+        self.client = Client()
+        self.client.force_login(self.user)
+        for i in range(2):
+            self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.client.post(reverse('place_order'), {
+            'first_name': 'John', 'last_name': 'Doe', 'phone': '123',
+            'email': 'john@example.com', 'address_line_1': '1 Street',
+            'address_line_2': '', 'country': 'UA', 'state': 'Kyiv',
+            'city': 'Kyiv', 'order_note': ''})
+        self.order = Order.objects.get()
+        self.client.post(reverse('payments'), json.dumps({
+            'orderID': self.order.order_number, 'transID': 'T1',
+            'payment_method': 'PayPal', 'status': 'COMPLETED',
+        }), content_type='application/json')
+        self.complete_url = (
+            reverse('order_complete') +
+            '?order_number=%s&payment_id=T1' % self.order.order_number)
+        self.detail_url = reverse(
+            'order_detail', args=[self.order.order_number])
+
+    def test_payment_snapshots_the_receipt(self):
+        receipt = OrderReceipt.objects.get(order=self.order)
+        self.assertEqual(receipt.data['subtotal'], 100)
+        self.assertEqual(receipt.data['lines'], [{
+            'product_name': 'Test product', 'variations': [],
+            'quantity': 2, 'product_price': 50}])
+
+    def test_receipt_views_read_the_snapshot(self):
+        for url in (self.complete_url, self.detail_url):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertContains(response, 'Test product')
+            self.assertContains(response, '$100.0 USD')
+            self.assertFalse([query for query in queries
+                              if 'orders_orderproduct' in query['sql']])
+
+    def test_receipts_are_private(self):
+        other = Account.objects.create_user(
+            first_name='Jane', last_name='Doe', username='janedoe',
+            email='jane@example.com', password='password')
+        other.is_active = True
+        other.save()
+        self.client.force_login(other)
+        self.assertRedirects(self.client.get(self.complete_url),
+                             reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    def test_wrong_transaction_id(self):
+        response = self.client.get(self.complete_url.replace('T1', 'T2'))
+        self.assertRedirects(response, reverse('home'),
+                             fetch_redirect_response=False)
+
+    def test_older_orders_are_snapshotted_on_first_view(self):
+        OrderReceipt.objects.all().delete()
+        self.assertContains(self.client.get(self.detail_url), '$100.0 USD')
+        self.assertTrue(OrderReceipt.objects.filter(order=self.order).exists())
+
+
+class OrderStatusTransitionTest(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_superuser(
+            first_name='Admin', last_name='User', username='admin',
+            email='admin@example.com', password='password')
+        self.orders = [self.create_order(str(1001 + i)) for i in range(3)]
+        self.unpaid = self.create_order('2001', paid=False)
+
+    def create_order(self, number, paid=True):
+        return Order.objects.create(
+            user=self.user, order_number=number, first_name='John',
+            last_name='Doe', phone='123', email='john@example.com',
+            address_line_1='1 Street', country='UA', state='Kyiv',
+            city='Kyiv', order_total=120, tax=20, is_ordered=paid)
+
+    def statuses(self):
+        return dict(Order.objects.values_list('order_number', 'status'))
+
+    def test_transition_is_one_conditional_update_per_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            moved = transition(Order.objects.all(), 'Accepted')
+        self.assertEqual(moved, 3)
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.statuses(), {
+            '1001': 'Accepted', '1002': 'Accepted', '1003': 'Accepted',
+            '2001': 'New'})
+        self.assertEqual(OrderNotification.objects.count(), 3)
+
+    def test_only_allowed_transitions(self):
+        self.assertEqual(transition(Order.objects.all(), 'Completed'), 0)
+        transition(Order.objects.filter(order_number='1001'), 'Accepted')
+        self.assertEqual(transition(
+            Order.objects.all(), 'Completed', batch_size=1), 1)
+        self.assertEqual(transition(Order.objects.all(), 'Cancelled'), 2)
+        self.assertEqual(self.statuses(), {
+            '1001': 'Completed', '1002': 'Cancelled', '1003': 'Cancelled',
+            '2001': 'New'})
+        with self.assertRaises(ValueError):
+            transition(Order.objects.all(), 'New')
+
+    def test_command_and_notifications(self):
+        out = StringIO()
+        call_command('transition_orders', 'Accepted', '--order', '1002',
+                     '--from', timezone.localdate().isoformat(), stdout=out)
+        self.assertIn('Moved 1 orders to Accepted', out.getvalue())
+        call_command('send_order_notifications', stdout=out)
+        self.assertIn('Sent 1 order notifications', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject,
+                         'Your order 1002 is accepted')
+        self.assertEqual(mail.outbox[0].to, ['john@example.com'])
+        self.assertFalse(OrderNotification.objects.filter(
+            sent_at__isnull=True).exists())
+
+    def test_admin_action(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.post(reverse('admin:orders_order_changelist'), {
+            'action': 'mark_accepted',
+            '_selected_action': [self.orders[0].id, self.unpaid.id],
+        }, follow=True)
+        self.assertContains(response, '1 of 2 orders marked Accepted.')
+        self.assertEqual(self.statuses()['1001'], 'Accepted')
+
+    def test_admin_searches_by_prefix(self):
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('admin:orders_order_changelist')
+        response = client.get(url + '?q=100')
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = client.get(url + '?q=john@')
+        self.assertEqual(response.context['cl'].result_count, 4)
+        response = client.get(url + '?q=Doe')
+        self.assertEqual(response.context['cl'].result_count, 0)
+        lookups = {
+            lookup.lookup_name for lookup
+            in response.context['cl'].queryset.query.where.children[0].children}
+        self.assertEqual(lookups, {'startswith'})
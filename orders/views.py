@@ -1,21 +1,54 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.http import HttpResponse, JsonResponse
 from carts.models import CartItem
 from .forms import OrderForm
-import datetime
-from .models import Order, Payment, OrderProduct
+from .models import Order, Payment, OrderProduct, PaymentIdempotencyKey
+from .rollups import record_customer, record_order
+from .inventory import OutOfStock, convert, reserve
+from .numbers import next_order_number
+from . import receipts
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+import hashlib
 import json
 from store.models import Product
 from django.core.mail import EmailMessage
+from django.db import transaction
 from django.template.loader import render_to_string
+from monitoring.metrics import ORDERS_PLACED, PAYMENTS_CONFIRMED
+from bootique.transactions import write_transaction
 
 # Create your views here.
 
 
+def _idempotency_key(body):
+    return hashlib.sha256(
+        f'{body["orderID"]}:{body["transID"]}'.encode()).hexdigest()
+
+
+def _replay(request, key):
+    response = PaymentIdempotencyKey.objects.filter(
+        key=key, user=request.user).values_list('response', flat=True).first()
+    if response is not None:
+        return JsonResponse(response)
+
+
+@write_transaction
 def payments(request):
     body = json.loads(request.body)
-    order = Order.objects.get(
-        user=request.user, is_ordered=False, order_number=body['orderID'])
+    # A retried callback gets the response of the one already processed
+    key = _idempotency_key(body)
+    replay = _replay(request, key)
+    if replay:
+        return replay
+
+    # Concurrent retries queue here; the loser sees the key once it may go
+    order = get_object_or_404(
+        Order.objects.select_for_update(), user=request.user,
+        order_number=body['orderID'])
+    if order.is_ordered:
+        return _replay(request, key) or JsonResponse(
+            {'error': 'This order has already been paid.'}, status=409)
 
     # Store transaction details inside Payment model
     payment = Payment(
@@ -30,6 +63,7 @@ def payments(request):
     order.payment = payment
     order.is_ordered = True
     order.save()
+    transaction.on_commit(PAYMENTS_CONFIRMED.inc)
 
     # Move the cart items to Order Product table
     cart_items = CartItem.objects.filter(user=request.user)
@@ -51,15 +85,16 @@ def payments(request):
         orderproduct.variations.set(product_variation)
         orderproduct.save()
 
-        # Reduce the quantity of the sold products
-        product = Product.objects.get(id=item.product_id)
-        product.stock -= item.quantity
-        product.save()
+    # Turn the stock held since place_order into sales
+    convert(order, cart_items)
+    record_order(order)
+    record_customer(order)
+    receipts.snapshot(order)
 
     # Clear cart
     CartItem.objects.filter(user=request.user).delete()
 
-    # Send order recieved email to customer
+    # Send order recieved email to customer, once the payment is committed
     mail_subject = 'Thank you for your order!'
     message = render_to_string('orders/order_recieved_email.html', {
         'user': request.user,
@@ -67,16 +102,19 @@ def payments(request):
     })
     to_email = request.user.email
     send_email = EmailMessage(mail_subject, message, to=[to_email])
-    send_email.send()
+    transaction.on_commit(send_email.send)
 
     # Send order number and transaction id back to sendData method via JsonResponse
     data = {
         'order_number': order.order_number,
         'transID': payment.payment_id,
     }
+    PaymentIdempotencyKey.objects.create(
+        key=key, user=request.user, order=order, response=data)
     return JsonResponse(data)
 
 
+@write_transaction
 def place_order(request, total=0, quantity=0,):
     current_user = request.user
 
@@ -113,21 +151,21 @@ def place_order(request, total=0, quantity=0,):
             data.order_total = grand_total
             data.tax = tax
             data.ip = request.META.get('REMOTE_ADDR')
-            data.save()
-            # Generate order number
-            yr = int(datetime.date.today().strftime('%Y'))
-            dt = int(datetime.date.today().strftime('%d'))
-            mt = int(datetime.date.today().strftime('%m'))
-            d = datetime.date(yr, mt, dt)
-            current_date = d.strftime("%Y%m%d")
-            order_number = current_date + str(data.id)
-            data.order_number = order_number
+            data.order_number = next_order_number()
             data.save()
 
-            order = Order.objects.get(
-                user=current_user, is_ordered=False, order_number=order_number)
+            try:
+                reserve(data, cart_items)
+            except OutOfStock as e:
+                data.delete()
+                product = Product.objects.get(id=e.product_id)
+                messages.error(
+                    request, f'Sorry, there is not enough {product} in stock.')
+                return redirect('cart')
+            transaction.on_commit(ORDERS_PLACED.inc)
+
             context = {
-                'order': order,
+                'order': data,
                 'cart_items': cart_items,
                 'total': total,
                 'tax': tax,
@@ -138,28 +176,20 @@ def place_order(request, total=0, quantity=0,):
         return redirect('checkout')
 
 
+@login_required(login_url='login')
 def order_complete(request):
-    order_number = request.GET.get('order_number')
+    receipt = receipts.for_user(
+        request.GET.get('order_number'), request.user)
     transID = request.GET.get('payment_id')
-
-    try:
-        order = Order.objects.get(order_number=order_number, is_ordered=True)
-        ordered_products = OrderProduct.objects.filter(order_id=order.id)
-
-        subtotal = 0
-        for i in ordered_products:
-            subtotal += i.product_price * i.quantity
-
-        payment = Payment.objects.get(payment_id=transID)
-
-        context = {
-            'order': order,
-            'ordered_products': ordered_products,
-            'order_number': order.order_number,
-            'transID': payment.payment_id,
-            'payment': payment,
-            'subtotal': subtotal,
-        }
-        return render(request, 'orders/order_complete.html', context)
-    except (Payment.DoesNotExist, Order.DoesNotExist):
+    if receipt is None or receipt['payment']['payment_id'] != transID:
         return redirect('home')
+
+    context = {
+        'order': receipt['order'],
+        'ordered_products': receipt['lines'],
+        'order_number': receipt['order']['order_number'],
+        'transID': transID,
+        'payment': receipt['payment'],
+        'subtotal': receipt['subtotal'],
+    }
+    return render(request, 'orders/order_complete.html', context)
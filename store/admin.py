@@ -1,5 +1,7 @@
 from django.contrib import admin
+from bootique.admin_tools import LargeTableAdmin, ProductFilter
 from .models import Product, Variation, ReviewRating, ProductGallery
+from .stock import rebalance, set_stock, unshard
 import admin_thumbnails
 
 # Register your models here.
@@ -11,21 +13,77 @@ class ProductGalleryInline(admin.TabularInline):
     extra = 1
 
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ('product_name', 'price', 'stock',
-                    'category', 'modified_date', 'is_available')
+                    'category', 'modified_date', 'is_available', 'is_hot')
+    list_select_related = ('category',)
+    list_filter = ('is_hot',)
+    search_fields = ('^product_name',)
+    autocomplete_fields = ('category',)
+    # Kept by store.popularity from buffered page views
+    readonly_fields = ('popularity',)
     prepopulated_fields = {'slug': ('product_name',)}
     inlines = [ProductGalleryInline]
 
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
+        if db_field.name == 'stock':
+            # Compare against the stock shown when the form was opened,
+            # not the row as reloaded on submit
+            formfield.show_hidden_initial = True
+        return formfield
 
-class VariationAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        # The stock of a hot product lives in its shards
+        was_hot = change and form.initial.get('is_hot')
+        stock_edited = 'stock' in form.changed_data
+        if change:
+            # Checkouts change stock and page views change popularity
+            # while the form is open, so their loaded values are stale
+            skip = {'popularity'} if stock_edited else {'popularity', 'stock'}
+            obj.save(update_fields=[
+                field.name for field in obj._meta.concrete_fields
+                if not field.primary_key and field.name not in skip])
+        else:
+            super().save_model(request, obj, form, change)
+        if obj.is_hot:
+            if stock_edited or not was_hot:
+                set_stock(obj.id, obj.stock)
+            else:
+                rebalance(obj.id)
+        elif was_hot:
+            if stock_edited:
+                obj.stock_shards.all().delete()
+            else:
+                unshard(obj.id)
+
+
+class VariationAdmin(LargeTableAdmin):
     list_display = ('product', 'variation_category',
                     'variation_value', 'is_active')
     list_editable = ('is_active',)
-    list_filter = ('product', 'variation_category', 'variation_value')
+    list_select_related = ('product',)
+    list_filter = (ProductFilter, 'variation_category')
+    search_fields = ('^variation_value',)
+    autocomplete_fields = ('product',)
+
+
+class ReviewRatingAdmin(LargeTableAdmin):
+    list_display = ('subject', 'product', 'user', 'rating', 'status',
+                    'created_at')
+    list_select_related = ('product', 'user')
+    list_filter = (ProductFilter, 'status')
+    autocomplete_fields = ('product', 'user')
+
+
+class ProductGalleryAdmin(LargeTableAdmin):
+    list_display = ('product', 'image')
+    list_select_related = ('product',)
+    list_filter = (ProductFilter,)
+    autocomplete_fields = ('product',)
 
 
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Variation, VariationAdmin)
-admin.site.register(ReviewRating)
-admin.site.register(ProductGallery)
+admin.site.register(ReviewRating, ReviewRatingAdmin)
+admin.site.register(ProductGallery, ProductGalleryAdmin)
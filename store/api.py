@@ -0,0 +1,222 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_safe
+
+from category.models import Category
+from .cache import get_catalog_version
+from .models import Product, ProductGallery, Variation
+
+# Read-only JSON API over the catalog. Rows are read with values() and
+# encoded with the stdlib encoder, lists are keyset paginated on id and
+# streamed in batches, and ETags come from the catalog version so a
+# revalidation costs no queries. Stock is left out: checkouts change it
+# without bumping the catalog version, so a 304 would serve a stale count.
+
+PRODUCT_COLUMNS = {
+    'id': 'id',
+    'product_name': 'product_name',
+    'slug': 'slug',
+    'description': 'description',
+    'price': 'price',
+    'is_available': 'is_available',
+    'images': 'images',
+    'category': 'category__slug',
+    'created_date': 'created_date',
+    'modified_date': 'modified_date',
+    'average_rating': 'average_rating',
+    'review_count': 'review_count',
+}
+PRODUCT_FIELDS = tuple(PRODUCT_COLUMNS) + ('url', 'variations', 'gallery')
+CATEGORY_FIELDS = ('id', 'category_name', 'slug', 'description', 'cat_image')
+
+encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _error(message):
+    return JsonResponse({'error': message}, status=400)
+
+
+def _fields(request, allowed):
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(allowed)
+    fields = [field for field in fields.split(',') if field]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise BadRequest('Unknown fields: %s' % ', '.join(unknown))
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise BadRequest('Invalid cursor')
+
+
+def catalog_etag(request, *args, **kwargs):
+    key = '%s:%s' % (get_catalog_version(), request.get_full_path())
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def _media_url(request, name):
+    if not name:
+        return None
+    return request.build_absolute_uri(settings.MEDIA_URL + name)
+
+
+def _products(fields):
+    if 'average_rating' in fields or 'review_count' in fields:
+        return Product.objects.with_rating()
+    return Product.objects.all()
+
+
+def _product_rows(request, queryset, fields):
+    """Serialize a batch of products, with two extra queries at most."""
+    columns = [PRODUCT_COLUMNS[field] for field in fields
+               if field in PRODUCT_COLUMNS]
+    rows = list(queryset.values(*set(columns)))
+    ids = [row['id'] for row in rows]
+
+    related = {}
+    if 'variations' in fields:
+        related['variations'] = Variation.objects.filter(
+            product_id__in=ids, is_active=True).values_list(
+            'product_id', 'variation_category', 'variation_value')
+    if 'gallery' in fields:
+        related['gallery'] = ProductGallery.objects.filter(
+            product_id__in=ids).values_list('product_id', 'image')
+    grouped = {}
+    for name, values in related.items():
+        grouped[name] = {product_id: [] for product_id in ids}
+        for item in values:
+            if name == 'variations':
+                grouped[name][item[0]].append(
+                    {'category': item[1], 'value': item[2]})
+            else:
+                grouped[name][item[0]].append(_media_url(request, item[1]))
+
+    for row in rows:
+        data = {}
+        for field in fields:
+            if field == 'url':
+                data['url'] = request.build_absolute_uri(reverse(
+                    'api_product_detail', args=[row['id']]))
+            elif field in grouped:
+                data[field] = grouped[field][row['id']]
+            elif field == 'images':
+                data['images'] = _media_url(request, row['images'])
+            elif field == 'average_rating':
+                rating = row['average_rating']
+                data['average_rating'] = round(rating, 2) if rating else 0
+            else:
+                data[field] = row[PRODUCT_COLUMNS[field]]
+        yield data
+
+
+def _stream(request, queryset, serialize, limit):
+    """Stream one keyset page as JSON, reading API_STREAM_BATCH_SIZE rows at a time."""
+    after = decode_cursor(request.GET.get('cursor'))
+    batch = settings.API_STREAM_BATCH_SIZE
+
+    def content():
+        yield '{"results":['
+        last_id, sent, first = after, 0, True
+        while sent < limit:
+            page = queryset.filter(id__gt=last_id).order_by('id')[
+                :min(batch, limit - sent)]
+            rows = list(serialize(page))
+            for row in rows:
+                yield ('' if first else ',') + encoder.encode(row)
+                first = False
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            sent += len(rows)
+        more = sent == limit and queryset.filter(id__gt=last_id).exists()
+        cursor = encode_cursor(last_id) if more else None
+        yield '],"next":%s}' % json.dumps(cursor)
+
+    return StreamingHttpResponse(content(), content_type='application/json')
+
+
+@require_safe
+@gzip_page
+@condition(etag_func=catalog_etag)
+def product_list(request):
+    try:
+        fields = _fields(request, PRODUCT_FIELDS)
+        limit = _limit(request)
+        decode_cursor(request.GET.get('cursor'))
+    except BadRequest as e:
+        return _error(str(e))
+    products = _products(fields).filter(is_available=True)
+    category = request.GET.get('category')
+    if category:
+        products = products.filter(category__slug=category)
+    return _stream(
+        request, products,
+        lambda page: _product_rows(request, page, fields), limit)
+
+
+@require_safe
+@gzip_page
+@condition(etag_func=catalog_etag)
+def product_detail(request, product_id):
+    try:
+        fields = _fields(request, PRODUCT_FIELDS)
+    except BadRequest as e:
+        return _error(str(e))
+    rows = list(_product_rows(request, _products(fields).filter(
+        pk=product_id, is_available=True), fields))
+    if not rows:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    return JsonResponse(rows[0], encoder=DjangoJSONEncoder)
+
+
+@require_safe
+@gzip_page
+@condition(etag_func=catalog_etag)
+def category_list(request):
+    try:
+        fields = _fields(request, CATEGORY_FIELDS)
+        limit = _limit(request)
+        decode_cursor(request.GET.get('cursor'))
+    except BadRequest as e:
+        return _error(str(e))
+
+    def serialize(page):
+        for row in page.values(*fields):
+            if 'cat_image' in row:
+                row['cat_image'] = _media_url(request, row['cat_image'])
+            yield row
+
+    return _stream(request, Category.objects.all(), serialize, limit)
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import api
+
+urlpatterns = [
+    path('products/', api.product_list, name='api_product_list'),
+    path('products/<int:product_id>/',
+         api.product_detail, name='api_product_detail'),
+    path('categories/', api.category_list, name='api_category_list'),
+]
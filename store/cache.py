@@ -0,0 +1,54 @@
+import time
+
+from django.core.cache import cache
+
+# Change counters used to version cached catalog fragments and pages. A
+# counter that was evicted is re-seeded from the clock, so it can never fall
+# back to a value that older entries were stored under.
+
+VERSION_KINDS = ('product', 'reviews', 'gallery')
+CATALOG_VERSION_KEY = 'store:version:catalog'
+
+
+def _version_key(kind, product_id):
+    return f'store:version:{kind}:{product_id}'
+
+
+def _seed():
+    return int(time.time() * 1000)
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), None)
+        return cache.get(key)
+
+
+def get_versions(product_id):
+    keys = {kind: _version_key(kind, product_id) for kind in VERSION_KINDS}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for kind, key in keys.items():
+        if key not in found:
+            cache.add(key, _seed(), None)
+            found[key] = cache.get(key)
+        versions[kind] = found[key]
+    return versions
+
+
+def bump_version(kind, product_id):
+    return _bump(_version_key(kind, product_id))
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _seed(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    return _bump(CATALOG_VERSION_KEY)
@@ -0,0 +1,249 @@
+import csv
+import hashlib
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from category.models import Category
+from .cache import bump_catalog_version, bump_version
+from .models import Product, Variation
+from .stock import set_stock
+
+# Flat catalog rows shared by the import_catalog and export_catalog
+# commands. One row per product; variations are "category:value" pairs,
+# joined with "|" in CSV and a list in JSONL.
+
+FIELDS = ('slug', 'product_name', 'description', 'price', 'stock',
+          'is_available', 'images', 'category_slug', 'category_name',
+          'variations')
+PRODUCT_FIELDS = ('product_name', 'description', 'price', 'stock',
+                  'is_available', 'images')
+
+
+class RowError(ValueError):
+    pass
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _variations(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [pair.split(':', 1) for pair in value.split('|') if pair]
+    try:
+        return sorted({(str(category).strip().lower(), str(val).strip())
+                       for category, val in value})
+    except ValueError:
+        raise RowError('variations must be category:value pairs')
+
+
+def normalize(raw):
+    """Validate an imported row and coerce it to the stored types."""
+    try:
+        row = {
+            'slug': raw['slug'].strip(),
+            'product_name': raw['product_name'].strip(),
+            'description': raw.get('description') or '',
+            'price': int(raw['price']),
+            'stock': int(raw['stock']),
+            'is_available': _bool(raw.get('is_available', True)),
+            'images': raw.get('images') or '',
+            'category_slug': raw['category_slug'].strip(),
+            'category_name': (raw.get('category_name')
+                              or raw['category_slug']).strip(),
+            'variations': _variations(raw.get('variations')),
+        }
+    except KeyError as e:
+        raise RowError('missing column %s' % e)
+    except (TypeError, ValueError) as e:
+        raise RowError(str(e))
+    if not row['slug'] or not row['product_name'] or not row['category_slug']:
+        raise RowError('slug, product_name and category_slug are required')
+    return row
+
+
+def content_hash(row):
+    data = json.dumps([row[field] for field in FIELDS if field != 'slug'],
+                      default=list)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def read_rows(f, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RowWriter:
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(f, fieldnames=FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            row = dict(row, variations='|'.join(
+                '%s:%s' % pair for pair in row['variations']))
+            self.writer.writerow(row)
+        else:
+            row = dict(row, variations=[list(pair)
+                                        for pair in row['variations']])
+            self.f.write(json.dumps(row) + '\n')
+
+
+def product_row(product, variations):
+    row = {field: getattr(product, field) for field in PRODUCT_FIELDS}
+    row['images'] = product.images.name or ''
+    row.update(
+        slug=product.slug,
+        category_slug=product.category.slug,
+        category_name=product.category.category_name,
+        variations=sorted((variation.variation_category,
+                           variation.variation_value)
+                          for variation in variations),
+    )
+    return row
+
+
+class CatalogImporter:
+    """Upsert normalized rows one batch per transaction.
+
+    Products are matched by slug. A row whose content hash equals the hash
+    of the stored product is skipped without writing. Variations missing
+    from a changed row are deactivated rather than deleted, since cart
+    items may still point at them.
+    """
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.created = self.updated = self.unchanged = 0
+
+    def import_batch(self, rows):
+        # Later rows for the same slug win
+        rows = list({row['slug']: row for row in rows}.values())
+        with transaction.atomic():
+            categories = self._categories(rows)
+            existing = {
+                product.slug: product for product in Product.objects.filter(
+                    slug__in=[row['slug'] for row in rows]).select_related(
+                    'category').prefetch_related('variation_set')}
+
+            changed = []
+            for row in rows:
+                product = existing.get(row['slug'])
+                if product is not None:
+                    variations = [variation for variation
+                                  in product.variation_set.all()
+                                  if variation.is_active]
+                    if content_hash(product_row(product, variations)) == \
+                            content_hash(row):
+                        self.unchanged += 1
+                        continue
+                changed.append((row, product))
+
+            if self.dry_run:
+                for row, product in changed:
+                    if product is None:
+                        self.created += 1
+                    else:
+                        self.updated += 1
+                transaction.set_rollback(True)
+                return
+
+            self._products(changed, categories)
+            self._variations(changed)
+            for row, product in changed:
+                bump_version('product', product.id)
+            if changed:
+                bump_catalog_version()
+
+    def _categories(self, rows):
+        names = {row['category_slug']: row['category_name'] for row in rows}
+        categories = Category.objects.in_bulk(list(names), field_name='slug')
+        new = [Category(slug=slug, category_name=name)
+               for slug, name in names.items() if slug not in categories]
+        renamed = []
+        for category in categories.values():
+            if category.category_name != names[category.slug]:
+                category.category_name = names[category.slug]
+                renamed.append(category)
+        if (new or renamed) and not self.dry_run:
+            Category.objects.bulk_create(new)
+            Category.objects.bulk_update(renamed, ['category_name'])
+            bump_catalog_version()
+        return Category.objects.in_bulk(list(names), field_name='slug')
+
+    def _products(self, changed, categories):
+        new, updated, restocked = [], [], []
+        now = timezone.now()
+        for i, (row, product) in enumerate(changed):
+            if product is None:
+                product = Product(slug=row['slug'])
+                new.append(product)
+                self.created += 1
+            else:
+                product.modified_date = now
+                if product.stock != row['stock']:
+                    restocked.append(product)
+                else:
+                    updated.append(product)
+                self.updated += 1
+            for field in PRODUCT_FIELDS:
+                setattr(product, field, row[field])
+            product.category = categories[row['category_slug']]
+            changed[i] = (row, product)
+        # Stock is only written for rows that change it, so stock sold
+        # since the batch was read is not overwritten. The stock of a hot
+        # product lives in its shards.
+        fields = tuple(field for field in PRODUCT_FIELDS if field != 'stock')
+        fields += ('category', 'modified_date')
+        Product.objects.bulk_update(
+            updated + [product for product in restocked if product.is_hot],
+            fields)
+        Product.objects.bulk_update(
+            [product for product in restocked if not product.is_hot],
+            fields + ('stock',))
+        for product in restocked:
+            if product.is_hot:
+                set_stock(product.id, product.stock)
+        Product.objects.bulk_create(new)
+        if new and new[0].pk is None:
+            # Backends without RETURNING leave the new keys unset
+            ids = Product.objects.in_bulk(
+                [product.slug for product in new], field_name='slug')
+            for product in new:
+                product.pk = ids[product.slug].pk
+
+    def _variations(self, changed):
+        wanted = {(product.id, category, value)
+                  for row, product in changed
+                  for category, value in row['variations']}
+        existing = Variation.objects.filter(
+            product_id__in=[product.id for row, product in changed])
+        keep, stale, found = [], [], set()
+        for variation in existing:
+            key = (variation.product_id, variation.variation_category,
+                   variation.variation_value)
+            if key in wanted and key not in found:
+                found.add(key)
+                if not variation.is_active:
+                    keep.append(variation.id)
+            elif variation.is_active:
+                stale.append(variation.id)
+        Variation.objects.filter(id__in=keep).update(is_active=True)
+        Variation.objects.filter(id__in=stale).update(is_active=False)
+        Variation.objects.bulk_create([
+            Variation(product_id=product_id, variation_category=category,
+                      variation_value=value)
+            for product_id, category, value in wanted - found])
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import build
+
+
+class Command(BaseCommand):
+    help = ('Fold paid orders into the co-purchase matrix and refresh the '
+            '"frequently bought together" products. Only orders paid since '
+            'the previous run are read unless --full is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=8,
+                            help='Recommendations kept per product')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Order lines per transaction')
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild from the whole order history')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        lines, products = build(
+            top=options['top'], chunk_size=options['chunk_size'],
+            full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {lines} order lines and refreshed {products} products '
+            f'in {time.monotonic() - started:.1f}s'))
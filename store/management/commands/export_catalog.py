@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from store.catalog_io import RowWriter, product_row
+from store.models import Product, Variation
+
+
+class Command(BaseCommand):
+    help = ('Write the catalog as CSV or JSONL, one row per product, '
+            'reading it in chunks so the table is never held in memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Output file, defaults to stdout')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else
+                                    'jsonl')
+        products = Product.objects.select_related('category').order_by(
+            'id').prefetch_related(Prefetch(
+                'variation_set',
+                queryset=Variation.objects.filter(is_active=True)))
+
+        started = time.monotonic()
+        f = self.stdout if path == '-' else open(
+            path, 'w', newline='', encoding='utf-8')
+        count = 0
+        try:
+            writer = RowWriter(f, fmt)
+            for product in products.iterator(chunk_size=options['chunk_size']):
+                writer.write(product_row(product, product.variation_set.all()))
+                count += 1
+        finally:
+            if f is not self.stdout:
+                f.close()
+
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        sys.stderr.write(f'Exported {count} products in {elapsed:.1f}s '
+                         f'({rate:.0f} rows/s)\n')
@@ -0,0 +1,65 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from store.catalog_io import CatalogImporter, RowError, normalize, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Upsert categories, products (matched by slug) and variations '
+            'from a CSV or JSONL feed, streaming it in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else
+                                    'jsonl')
+        f = sys.stdin if path == '-' else open(
+            path, newline='', encoding='utf-8')
+        importer = CatalogImporter(dry_run=options['dry_run'])
+        started = time.monotonic()
+        batch, total = [], 0
+        try:
+            for line, raw in enumerate(read_rows(f, fmt), start=1):
+                try:
+                    batch.append(normalize(raw))
+                except RowError as e:
+                    raise CommandError(f'Row {line}: {e}')
+                if len(batch) >= options['batch_size']:
+                    total += self.flush(importer, batch, line, started)
+                    batch = []
+            if batch:
+                total += self.flush(importer, batch, line, started)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Would import" if options["dry_run"] else "Imported"} '
+            f'{total} rows in {elapsed:.1f}s ({rate:.0f} rows/s): '
+            f'{importer.created} created, {importer.updated} updated, '
+            f'{importer.unchanged} unchanged'))
+
+    def flush(self, importer, batch, line, started):
+        try:
+            importer.import_batch(batch)
+        except IntegrityError as e:
+            raise CommandError(
+                f'Batch ending at row {line} was rolled back: {e}')
+        if self.verbosity > 1:
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{line} rows read in {elapsed:.1f}s')
+        return len(batch)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.cache import bump_catalog_version, bump_version
+from store.models import Product
+from store.stock import rebalance
+
+
+class Command(BaseCommand):
+    help = ('Even out the stock shards of hot products and refresh their '
+            'displayed stock. Run it every minute or so during a sale.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int,
+                            help='Only rebalance this product id')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        products = Product.objects.filter(is_hot=True)
+        if options['product']:
+            products = products.filter(id=options['product'])
+        changed = False
+        count = 0
+        for product_id, stock in products.values_list('id', 'stock'):
+            total = rebalance(product_id)
+            if (stock == 0) != (total == 0):
+                bump_version('product', product_id)
+                changed = True
+            count += 1
+        if changed:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebalanced {count} hot products in '
+            f'{time.monotonic() - started:.1f}s'))
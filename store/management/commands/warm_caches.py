@@ -0,0 +1,145 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import urlopen
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Sum
+from django.test import Client
+from django.urls import reverse
+
+from category.models import Category
+from orders.models import OrderProduct
+from store.models import Product
+
+
+# Backends whose entries live in the process that wrote them
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class Command(BaseCommand):
+    help = ('Render the most visited pages as an anonymous visitor so the '
+            'page and fragment caches are warm after a deploy or flush. '
+            'With --base-url the pages are requested from a running server, '
+            'which is the only way to warm a process-local cache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*',
+                            help='Extra paths to warm, e.g. /store/')
+        parser.add_argument('--file',
+                            help='File with one path per line')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of best selling products to warm')
+        parser.add_argument('--all-products', action='store_true',
+                            help='Warm every available product page')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--budget', type=float, default=60,
+                            help='Stop starting new requests after this many '
+                                 'seconds')
+        parser.add_argument('--host', default='localhost',
+                            help='Host header for pages rendered in this '
+                                 'process')
+        parser.add_argument('--base-url',
+                            help='Request the pages from the server at this '
+                                 'URL instead of rendering them in this '
+                                 'process, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Seconds to wait for each page with '
+                                 '--base-url')
+
+    def get_urls(self, options):
+        urls = [reverse('home'), reverse('store')]
+        urls += [category.get_url() for category in Category.objects.all()]
+
+        best_sellers = OrderProduct.objects.filter(
+            ordered=True, product__is_available=True).values(
+            'product_id').annotate(sold=Sum('quantity')).order_by('-sold')
+        ids = [row['product_id'] for row in best_sellers[:options['top']]]
+        products = Product.objects.filter(
+            id__in=ids).select_related('category').in_bulk()
+        urls += [products[i].get_url() for i in ids if i in products]
+
+        if options['all_products']:
+            urls += [product.get_url() for product in Product.objects.filter(
+                is_available=True).select_related('category').iterator()]
+
+        urls += options['urls']
+        if options['file']:
+            with open(options['file']) as f:
+                urls += [line.strip() for line in f if line.strip()]
+
+        # Keep the first occurrence, it carries the priority
+        return list(dict.fromkeys(urls))
+
+    def handle(self, *args, **options):
+        urls = self.get_urls(options)
+        host = options['host']
+        started = time.monotonic()
+        deadline = started + options['budget']
+
+        base_url = options['base_url']
+        backend = caches['default']
+        if base_url is None and isinstance(backend, PROCESS_LOCAL_CACHES):
+            self.stderr.write(self.style.WARNING(
+                f'The {type(backend).__name__} cache backend is local to this '
+                'process, so pages rendered here do not warm the server. '
+                'Use --base-url to request them from the server.'))
+
+        def fetch(url):
+            if base_url is None:
+                return Client(HTTP_HOST=host).get(url).status_code
+            try:
+                with urlopen(urljoin(base_url, url),
+                             timeout=options['timeout']) as response:
+                    response.read()
+                    return response.status
+            except HTTPError as e:
+                return e.code
+            except URLError as e:
+                return f'ERR {e.reason}'
+
+        def warm(url):
+            if time.monotonic() > deadline:
+                return url, None, None
+            begin = time.monotonic()
+            status = fetch(url)
+            return url, status, time.monotonic() - begin
+
+        def warm_in_thread(url):
+            try:
+                return warm(url)
+            finally:
+                # Each pool thread opened its own connections
+                connections.close_all()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(warm_in_thread, urls))
+        else:
+            results = [warm(url) for url in urls]
+
+        warmed, failed, skipped = 0, 0, 0
+        timings = []
+        for url, status, elapsed in results:
+            if status is None:
+                skipped += 1
+                continue
+            timings.append(elapsed)
+            if status == 200:
+                warmed += 1
+            else:
+                failed += 1
+            self.stdout.write(f'{status} {elapsed * 1000:8.1f} ms  {url}')
+
+        timings.sort()
+        summary = (f'Warmed {warmed} pages, {failed} failed, {skipped} skipped '
+                   f'(budget) in {time.monotonic() - started:.1f}s')
+        if timings:
+            summary += (f'; median {timings[len(timings) // 2] * 1000:.1f} ms,'
+                        f' max {timings[-1] * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import F, Value
+from django.db.models.functions import Log, Power
+
+
+def to_log_space(apps, schema_editor):
+    # 0 keeps meaning no views: log2(1 + sum), see store.popularity
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(popularity__gt=0).update(
+        popularity=Log(2, F('popularity') + Value(1.0)))
+
+
+def from_log_space(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(popularity__gt=0).update(
+        popularity=Power(2, F('popularity')) - Value(1.0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_popularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_log_space, from_log_space),
+    ]
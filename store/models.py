@@ -2,11 +2,20 @@ from django.db import models
 from django.urls import reverse
 from category.models import Category
 from accounts.models import Account
-from django.db.models import Avg, Count
+from django.db.models import Avg, Count, Q
 
 # Create your models here.
 
 
+class ProductManager(models.Manager):
+    def with_rating(self):
+        approved = Q(reviewrating__status=True)
+        return super(ProductManager, self).annotate(
+            average_rating=Avg('reviewrating__rating', filter=approved),
+            review_count=Count('reviewrating', filter=approved),
+        )
+
+
 class Product(models.Model):
     product_name = models.CharField(max_length=200, unique=True)
     slug = models.SlugField(max_length=200, unique=True)
@@ -15,10 +24,16 @@ class Product(models.Model):
     images = models.ImageField(upload_to='photos/products')
     stock = models.PositiveIntegerField()
     is_available = models.BooleanField(default=True)
+    # Hot products keep their stock in StockShard rows (store.stock)
+    is_hot = models.BooleanField(default=False)
+    # log2 of the decayed view count kept by store.popularity
+    popularity = models.FloatField(default=0, db_index=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     created_date = models.DateTimeField(auto_now_add=True)
     modified_date = models.DateTimeField(auto_now=True)
 
+    objects = ProductManager()
+
     def get_url(self):
         return reverse('product_detail', args=[self.category.slug, self.slug])
 
@@ -96,3 +111,47 @@ class ProductGallery(models.Model):
     class Meta:
         verbose_name = 'productgallery'
         verbose_name_plural = 'product gallery'
+
+
+class CoPurchase(models.Model):
+    # Sparse co-occurrence matrix: how many paid orders contain both
+    # products. Stored in both directions, built by store.recommendations.
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+
+
+class ProductRecommendation(models.Model):
+    # Top co-purchased products per product, read by product_detail
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
+        ordering = ['rank']
+
+
+class CoPurchaseProgress(models.Model):
+    # Last OrderProduct id folded into CoPurchase
+    last_line_id = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class StockShard(models.Model):
+    # One of STOCK_SHARDS counters holding a hot product's stock
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'shard')
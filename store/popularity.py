@@ -0,0 +1,130 @@
+import asyncio
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest, Least, Log, Power
+from django.dispatch import receiver
+
+from .models import Product
+
+# Product views are counted in memory and added to Product.popularity in
+# one UPDATE per flush, at most every PRODUCT_VIEW_FLUSH_SECONDS or
+# PRODUCT_VIEW_FLUSH_SIZE views, so a page view never writes a row. Views
+# are counted outside the page cache, keyed by product slug, so cached
+# hits count too without a query. The flush runs on request_finished,
+# after the response has been sent; views still buffered when a process
+# exits are lost.
+#
+# The score decays with forward decay: a view at time t weighs
+# 2 ** ((t - EPOCH) / half-life), so newer views weigh more and scores of
+# different products compare directly without ever rewriting old rows.
+# Those weights overflow a float after 1024 half-lives, so the column keeps
+# log2 of the sum instead and a flush adds to it in log space. The default
+# of 0 stands for one view at EPOCH, which any later view outweighs.
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+
+_lock = threading.Lock()
+_views = Counter()
+_pending = 0
+_last_flush = time.monotonic()
+
+
+def log_weight(now=None):
+    """log2 of what one view at ``now`` adds to a product's popularity."""
+    now = time.time() if now is None else now
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 86400
+    return (now - EPOCH) / half_life
+
+
+def _log_add(score, added):
+    """log2(2 ** score + 2 ** added) without leaving log space."""
+    high, low = Greatest(score, added), Least(score, added)
+    return high + Log(2, Value(1.0) + Power(2, low - high))
+
+
+def record_view(slug):
+    global _pending
+    with _lock:
+        _views[slug] += 1
+        _pending += 1
+
+
+def is_due():
+    with _lock:
+        return _pending > 0 and (
+            _pending >= settings.PRODUCT_VIEW_FLUSH_SIZE
+            or time.monotonic() - _last_flush
+            >= settings.PRODUCT_VIEW_FLUSH_SECONDS)
+
+
+def clear():
+    """Drop the buffered views without writing them."""
+    global _pending
+    with _lock:
+        _views.clear()
+        _pending = 0
+
+
+def flush(now=None):
+    """Add the buffered views to the products' scores; return how many
+    views were written."""
+    global _pending, _last_flush
+    with _lock:
+        views = dict(_views)
+        _views.clear()
+        _pending = 0
+        _last_flush = time.monotonic()
+    if not views:
+        return 0
+    try:
+        ids = dict(Product.objects.filter(slug__in=views).values_list(
+            'slug', 'id'))
+        if ids:
+            step = log_weight(now)
+            added = Case(
+                *[When(id=product_id,
+                       then=Value(math.log2(views[slug]) + step))
+                  for slug, product_id in ids.items()],
+                output_field=FloatField())
+            Product.objects.filter(id__in=ids.values()).update(
+                popularity=_log_add(F('popularity'), added))
+    except Exception:
+        # Keep the views for the next flush
+        with _lock:
+            _views.update(views)
+            _pending += sum(views.values())
+        raise
+    return sum(views.values())
+
+
+def count_product_views(view_func):
+    """Count successful product_detail responses, cached ones included."""
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, category_slug, product_slug):
+            response = await view_func(request, category_slug, product_slug)
+            if response.status_code == 200:
+                record_view(product_slug)
+            return response
+    else:
+        @wraps(view_func)
+        def _wrapped_view(request, category_slug, product_slug):
+            response = view_func(request, category_slug, product_slug)
+            if response.status_code == 200:
+                record_view(product_slug)
+            return response
+    return _wrapped_view
+
+
+@receiver(request_finished)
+def flush_when_due(sender, **kwargs):
+    if is_due():
+        flush()
@@ -0,0 +1,119 @@
+from collections import Counter
+from datetime import timedelta
+from itertools import permutations
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from orders.models import OrderProduct
+from .cache import bump_catalog_version
+from .models import CoPurchase, CoPurchaseProgress, ProductRecommendation
+
+# "Frequently bought together", precomputed by the build_recommendations
+# command. Paid order lines are folded into the CoPurchase matrix in
+# chunks of line ids; an order belongs to the chunk holding its first
+# line, so an incremental run never counts an order twice. Lines from the
+# last minute wait for the next run, when their transaction has surely
+# committed with all of the order's lines.
+
+LAG = timedelta(minutes=1)
+
+
+def _fold_chunk(lo, hi):
+    """Add the orders whose first paid line id is in (lo, hi]."""
+    paid = OrderProduct.objects.filter(ordered=True)
+    order_ids = set(paid.filter(id__gt=lo, id__lte=hi).values_list(
+        'order_id', flat=True))
+    orders = {}
+    for order_id, line_id, product_id in paid.filter(
+            order_id__in=order_ids).values_list(
+            'order_id', 'id', 'product_id'):
+        first, products = orders.setdefault(order_id, [line_id, set()])
+        orders[order_id][0] = min(first, line_id)
+        products.add(product_id)
+
+    pairs = Counter()
+    for first, products in orders.values():
+        if first > lo:
+            pairs.update(permutations(products, 2))
+    if not pairs:
+        return set()
+
+    products = {product for pair in pairs for product in pair}
+    existing = {
+        (row.product_id, row.other_id): row
+        for row in CoPurchase.objects.filter(
+            product_id__in=products, other_id__in=products)}
+    new, changed = [], []
+    for (product, other), count in pairs.items():
+        row = existing.get((product, other))
+        if row is None:
+            new.append(CoPurchase(
+                product_id=product, other_id=other, count=count))
+        else:
+            row.count += count
+            changed.append(row)
+    CoPurchase.objects.bulk_update(changed, ['count'], batch_size=500)
+    CoPurchase.objects.bulk_create(new, batch_size=500)
+    return products
+
+
+def _refresh_top(products, top):
+    ranked = CoPurchase.objects.filter(product_id__in=products).annotate(
+        rank=Window(RowNumber(), partition_by=F('product_id'),
+                    order_by=[F('count').desc(), F('other_id').asc()]),
+    ).filter(rank__lte=top)
+    recommendations = [
+        ProductRecommendation(
+            product_id=row.product_id, recommended_id=row.other_id,
+            rank=row.rank, score=row.count)
+        for row in ranked]
+    ProductRecommendation.objects.filter(product_id__in=products).delete()
+    ProductRecommendation.objects.bulk_create(recommendations, batch_size=500)
+
+
+def for_product(product_id):
+    """The product page's recommendations: one lookup on (product, rank)."""
+    return ProductRecommendation.objects.filter(
+        product_id=product_id, recommended__is_available=True,
+    ).select_related('recommended__category')
+
+
+def build(top=8, chunk_size=5000, full=False):
+    """Fold new paid orders into the matrix and refresh the top ``top``
+    recommendations of every product they touched. Returns the number of
+    lines read and of products refreshed."""
+    progress, created = CoPurchaseProgress.objects.get_or_create(pk=1)
+    if full:
+        with transaction.atomic():
+            CoPurchase.objects.all().delete()
+            ProductRecommendation.objects.all().delete()
+            CoPurchaseProgress.objects.filter(pk=1).update(last_line_id=0)
+        progress.last_line_id = 0
+
+    cutoff = timezone.now() - LAG
+    lines = OrderProduct.objects.filter(
+        ordered=True, created_at__lte=cutoff).order_by('id')
+    touched, read = set(), 0
+    lo = progress.last_line_id
+    while True:
+        ids = list(lines.filter(id__gt=lo).values_list(
+            'id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            touched |= _fold_chunk(lo, ids[-1])
+            CoPurchaseProgress.objects.filter(pk=1).update(
+                last_line_id=ids[-1])
+        lo = ids[-1]
+        read += len(ids)
+
+    products = sorted(touched)
+    for i in range(0, len(products), 500):
+        with transaction.atomic():
+            _refresh_top(products[i:i + 500], top)
+    if products:
+        bump_catalog_version()
+    return read, len(products)
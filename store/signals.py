@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from category.models import Category
+from .cache import bump_catalog_version, bump_version
+from .models import Product, ProductGallery, ReviewRating, Variation
+
+# Every catalog change also bumps the catalog version, which keys the
+# anonymous page cache (bootique.page_cache).
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    bump_version('product', instance.id)
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=Variation)
+def variation_changed(sender, instance, **kwargs):
+    bump_version('product', instance.product_id)
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=ReviewRating)
+def review_changed(sender, instance, **kwargs):
+    bump_version('reviews', instance.product_id)
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=ProductGallery)
+def gallery_changed(sender, instance, **kwargs):
+    bump_version('gallery', instance.product_id)
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    bump_catalog_version()
@@ -0,0 +1,117 @@
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Product, StockShard
+
+# Sharded stock for products flagged is_hot. Their stock lives in
+# STOCK_SHARDS counter rows, so concurrent buyers update different rows
+# instead of queueing on the product row's lock. Product.stock keeps the
+# total for display; it is refreshed when a product sells out or comes
+# back and by the rebalance_stock_shards command.
+
+
+def _split(total, shards):
+    base, extra = divmod(total, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def available(product):
+    if not product.is_hot:
+        return product.stock
+    return StockShard.objects.filter(product=product).aggregate(
+        total=Sum('quantity'))['total'] or 0
+
+
+def set_stock(product_id, total, shards=None):
+    """Spread total evenly over the product's shards."""
+    shards = shards or settings.STOCK_SHARDS
+    with transaction.atomic():
+        StockShard.objects.filter(product_id=product_id).delete()
+        StockShard.objects.bulk_create([
+            StockShard(product_id=product_id, shard=i, quantity=quantity)
+            for i, quantity in enumerate(_split(total, shards))])
+        Product.objects.filter(id=product_id).update(stock=total)
+
+
+def unshard(product_id):
+    """Fold the shards back into Product.stock."""
+    with transaction.atomic():
+        total = rebalance(product_id)
+        StockShard.objects.filter(product_id=product_id).delete()
+    return total
+
+
+def rebalance(product_id):
+    """Even out the shards of a product and refresh Product.stock.
+
+    A product flagged without shards gets them from Product.stock.
+    """
+    with transaction.atomic():
+        shards = list(StockShard.objects.select_for_update().filter(
+            product_id=product_id).order_by('shard'))
+        if not shards:
+            total = Product.objects.values_list('stock', flat=True).get(
+                id=product_id)
+            set_stock(product_id, total)
+            return total
+        total = sum(shard.quantity for shard in shards)
+        for shard, quantity in zip(shards, _split(total, len(shards))):
+            shard.quantity = quantity
+        StockShard.objects.bulk_update(shards, ['quantity'])
+        Product.objects.filter(id=product_id).update(stock=total)
+    return total
+
+
+def _mark_sold_out(product_id):
+    return bool(Product.objects.filter(id=product_id, stock__gt=0).update(
+        stock=0))
+
+
+def take(product_id, quantity):
+    """Take quantity from one random shard that has enough.
+
+    When no single shard has enough, the shards are locked in order and
+    drained together, which only happens as a product runs low. Returns
+    whether the quantity was taken and whether the product just sold out.
+    """
+    shards = StockShard.objects.filter(product_id=product_id)
+    order = list(range(settings.STOCK_SHARDS))
+    random.shuffle(order)
+    for i in order:
+        shard = shards.filter(shard=i)
+        if shard.filter(quantity__gt=quantity).update(
+                quantity=F('quantity') - quantity):
+            return True, False
+        # Emptying a shard may sell the product out
+        if shard.filter(quantity=quantity).update(quantity=0):
+            return True, (not shards.filter(quantity__gt=0).exists()
+                          and _mark_sold_out(product_id))
+
+    with transaction.atomic():
+        locked = list(shards.select_for_update().order_by('shard'))
+        total = sum(shard.quantity for shard in locked)
+        if total < quantity:
+            return False, total == 0 and _mark_sold_out(product_id)
+        remaining = quantity
+        for shard in locked:
+            taken = min(shard.quantity, remaining)
+            shard.quantity -= taken
+            remaining -= taken
+        StockShard.objects.bulk_update(locked, ['quantity'])
+        return True, total == quantity and _mark_sold_out(product_id)
+
+
+def give(product_id, quantity):
+    """Return quantity to a random shard; return whether the product was
+    sold out until now."""
+    shards = StockShard.objects.filter(product_id=product_id)
+    if not shards.filter(shard=random.randrange(settings.STOCK_SHARDS)).update(
+            quantity=F('quantity') + quantity):
+        # Fewer shards than configured; use any of them
+        shards.filter(pk=shards.values_list('pk', flat=True).first()).update(
+            quantity=F('quantity') + quantity)
+    return bool(Product.objects.filter(id=product_id, stock=0).update(
+        stock=quantity))
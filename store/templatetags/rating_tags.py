@@ -0,0 +1,32 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+STAR = '<i class="fa fa-star{}" aria-hidden="true"></i>'
+
+
+def _render_stars(half_steps):
+    stars = []
+    for i in range(1, 6):
+        if half_steps >= 2 * i:
+            stars.append(STAR.format(''))
+        elif half_steps == 2 * i - 1:
+            stars.append(STAR.format('-half-o'))
+        else:
+            stars.append(STAR.format('-o'))
+    return mark_safe('<span>{}</span>'.format('\n'.join(stars)))
+
+
+# A rating rounds down to a half step, so there are only 11 distinct
+# renderings (0, 0.5, ... 5). Build them once at import time.
+RENDERED_STARS = tuple(_render_stars(i) for i in range(11))
+
+
+@register.simple_tag
+def star_rating(value):
+    try:
+        half_steps = int(float(value or 0) * 2)
+    except (TypeError, ValueError):
+        half_steps = 0
+    return RENDERED_STARS[min(max(half_steps, 0), 10)]
@@ -1,10 +1,40 @@
-from django.test import TestCase, Client
-from .models import Product, Variation, ReviewRating, ProductGallery
+from django.test import (TestCase, Client, LiveServerTestCase,
+                         override_settings)
+from django.template import Context, Template
+from .models import (Product, Variation, ReviewRating, ProductGallery,
+                     CoPurchase, ProductRecommendation, StockShard)
 from accounts.models import Account
 from category.models import Category
 from carts.models import Cart, CartItem
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from datetime import timedelta
+from django.utils import timezone
+from orders.models import Order, OrderProduct
+import gzip
+import json
+import math
+import os
+import tempfile
+from unittest.mock import patch
+from urllib.parse import urlparse
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from .cache import get_versions
+from .templatetags.rating_tags import RENDERED_STARS
+from . import popularity, stock
+from .views import product_detail_async, search_async, store_async
+from django.test import AsyncRequestFactory, RequestFactory
+from bootique.cache import _acquire, _release
+from bootique.page_cache import _page_key
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
 
 # Create your tests here.
 
@@ -106,6 +136,8 @@ class ProductGalleryModelTest(TestCase):
 
 class StoreViewsTest(TestCase):
     def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
         self.client = Client()
         self.category = Category.objects.create(
             category_name='Test category', slug='test-category')
@@ -152,6 +184,8 @@ class StoreViewsTest(TestCase):
 
 class ProductDetailViewTest(TestCase):
     def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
         self.client = Client()
         self.category = Category.objects.create(category_name='Test category')
         self.product = Product.objects.create(
@@ -188,3 +222,872 @@ class ProductDetailViewTest(TestCase):
         self.assertContains(response, 'Test product description')
         self.assertContains(response, 10)
         self.assertContains(response, 'In Cart')
+
+
+class ProductDetailFragmentCacheTest(TestCase):
+    def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
+        cache.clear()
+        self.client = Client()
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product',
+            slug='test-product',
+            price=100,
+            stock=10,
+            category=self.category,
+            images='photos/products/test.jpg',
+        )
+        self.user = Account.objects.create(
+            email='testuser@test.com', username='testuser')
+        Variation.objects.create(
+            product=self.product, variation_category='color',
+            variation_value='red')
+        self.url = reverse('product_detail', args=[
+                           'test-category', 'test-product'])
+
+    def test_fragments_are_served_from_cache(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Red')
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('store_variation', sql)
+        self.assertNotIn('store_productgallery', sql)
+        self.assertNotIn('"store_reviewrating"."review"', sql)
+
+    def test_signals_bump_versions(self):
+        versions = get_versions(self.product.id)
+        ReviewRating.objects.create(
+            product=self.product, user=self.user, subject='Great',
+            review='Nice fit', rating=4)
+        ProductGallery.objects.create(
+            product=self.product, image='store/products/test.jpg')
+        new_versions = get_versions(self.product.id)
+        self.assertEqual(new_versions['product'], versions['product'])
+        self.assertGreater(new_versions['reviews'], versions['reviews'])
+        self.assertGreater(new_versions['gallery'], versions['gallery'])
+
+    def test_variation_change_invalidates_fragment(self):
+        self.client.get(self.url)
+        Variation.objects.create(
+            product=self.product, variation_category='color',
+            variation_value='blue')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Blue')
+
+
+class StarRatingTagTest(TestCase):
+    def render(self, value):
+        template = Template('{% load rating_tags %}{% star_rating value %}')
+        return template.render(Context({'value': value}))
+
+    def test_star_rating_half_steps(self):
+        html = self.render(2.5)
+        self.assertEqual(html.count('fa-star"'), 2)
+        self.assertEqual(html.count('fa-star-half-o'), 1)
+        self.assertEqual(html.count('fa-star-o'), 2)
+
+    def test_star_rating_rounds_down_and_clamps(self):
+        self.assertEqual(self.render(2.4), RENDERED_STARS[4])
+        self.assertEqual(self.render(None), RENDERED_STARS[0])
+        self.assertEqual(self.render(7), RENDERED_STARS[10])
+        self.assertEqual(self.render('bad'), RENDERED_STARS[0])
+
+    def test_with_rating_annotation(self):
+        category = Category.objects.create(
+            category_name='test_category', slug='test_category')
+        product = Product.objects.create(
+            product_name='Test Product', slug='test-product', price=100,
+            stock=10, category=category)
+        user = Account.objects.create(
+            email='testuser@test.com', username='testuser')
+        ReviewRating.objects.create(
+            product=product, user=user, rating=4, status=True)
+        ReviewRating.objects.create(
+            product=product, user=user, rating=5, status=True)
+        ReviewRating.objects.create(
+            product=product, user=user, rating=1, status=False)
+        annotated = Product.objects.with_rating().get(id=product.id)
+        self.assertEqual(annotated.average_rating, product.averageReview())
+        self.assertEqual(annotated.review_count, product.countReview())
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
+        cache.clear()
+        self.client = Client()
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product',
+            slug='test-product',
+            price=100,
+            stock=10,
+            category=self.category,
+            images='photos/products/test.jpg',
+        )
+        self.url = reverse('product_detail', args=[
+                           'test-category', 'test-product'])
+
+    def test_second_anonymous_hit_renders_nothing(self):
+        self.client.get(reverse('store'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('store'))
+        self.assertEqual(len(queries), 0)
+        self.assertContains(response, 'Test product')
+        self.assertNotContains(response, '__page_cache_')
+
+    def test_cart_badge_is_filled_per_visitor(self):
+        self.client.get(self.url)
+        shopper = Client()
+        shopper.get(reverse('add_to_cart', args=[self.product.id]))
+        shopper.get(reverse('add_to_cart', args=[self.product.id]))
+        response = shopper.get(self.url)
+        self.assertEqual(response.context, None)
+        self.assertContains(response, '>2</span')
+        response = self.client.get(self.url)
+        self.assertContains(response, '>0</span')
+
+    def test_csrf_token_is_per_request(self):
+        self.client.get(self.url)
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(self.url)
+        self.assertEqual(response.context, None)
+        self.assertIn('csrftoken', response.cookies)
+        self.assertNotContains(response, '__page_cache_csrf_token__')
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value="')
+
+    def test_catalog_change_invalidates_page(self):
+        self.client.get(reverse('store'))
+        Product.objects.create(
+            product_name='Another product', slug='another-product',
+            price=10, stock=1, category=self.category,
+            images='photos/products/test.jpg')
+        response = self.client.get(reverse('store'))
+        self.assertContains(response, 'Another product')
+
+    def test_previous_page_served_while_it_is_rebuilt(self):
+        self.client.get(reverse('store'))
+        Product.objects.create(
+            product_name='Another product', slug='another-product',
+            price=10, stock=1, category=self.category,
+            images='photos/products/test.jpg')
+        request = RequestFactory().get(reverse('store'))
+        key = _page_key(request)
+        token = _acquire(cache, key)
+        response = self.client.get(reverse('store'))
+        self.assertEqual(response.context, None)
+        self.assertNotContains(response, 'Another product')
+        _release(cache, key, token)
+        response = self.client.get(reverse('store'))
+        self.assertContains(response, 'Another product')
+
+    def test_authenticated_users_bypass_cache(self):
+        user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='johndoe@example.com', password='password')
+        user.is_active = True
+        user.save()
+        self.client.get(reverse('store'))
+        self.client.force_login(user)
+        response = self.client.get(reverse('store'))
+        self.assertIsNotNone(response.context)
+
+    @override_settings(PAGE_CACHE_BYPASS_NON_EMPTY_CART=True)
+    def test_non_empty_cart_bypass(self):
+        self.client.get(self.url)
+        self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        response = self.client.get(self.url)
+        self.assertIsNotNone(response.context)
+
+
+class AsyncCatalogViewsTest(TestCase):
+    def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product',
+            slug='test-product',
+            price=100,
+            stock=10,
+            category=self.category,
+            images='photos/products/test.jpg',
+        )
+
+    def request(self, path):
+        request = self.factory.get(path)
+        request.session = SessionStore()
+        request.user = AnonymousUser()
+        return request
+
+    async def test_store_async(self):
+        response = await store_async(self.request('/store/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Test product')
+        self.assertContains(response, '<b>1</b>')
+
+    async def test_store_async_unknown_category(self):
+        from django.http import Http404
+        with self.assertRaises(Http404):
+            await store_async(self.request('/store/category/missing/'),
+                              category_slug='missing')
+
+    async def test_product_detail_async(self):
+        path = '/store/category/test-category/test-product/'
+        response = await product_detail_async(
+            self.request(path), 'test-category', 'test-product')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Test product')
+        self.assertNotContains(response, '__page_cache_')
+
+    async def test_product_detail_async_served_from_page_cache(self):
+        path = '/store/category/test-category/test-product/'
+        await product_detail_async(
+            self.request(path), 'test-category', 'test-product')
+        # queryset updates skip the signals that bump the catalog version
+        await Product.objects.filter(pk=self.product.pk).aupdate(
+            description='Changed description')
+        response = await product_detail_async(
+            self.request(path), 'test-category', 'test-product')
+        self.assertNotContains(response, 'Changed description')
+
+    async def test_search_async(self):
+        response = await search_async(self.request('/store/search/?keyword=Test'))
+        self.assertContains(response, 'Test product')
+        response = await search_async(self.request('/store/search/?keyword=zzz'))
+        self.assertNotContains(response, 'Test product')
+
+
+class CatalogApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='johndoe@example.com', password='password')
+        self.products = []
+        for i in range(5):
+            product = Product.objects.create(
+                product_name='Product %d' % i, slug='product-%d' % i,
+                price=10 + i, stock=5, category=self.category,
+                images='photos/products/test.jpg')
+            Variation.objects.create(
+                product=product, variation_category='color',
+                variation_value='red')
+            ReviewRating.objects.create(
+                product=product, user=self.user, rating=4.0)
+            self.products.append(product)
+
+    def get_json(self, url, **extra):
+        response = self.client.get(url, **extra)
+        content = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        return response, json.loads(content)
+
+    def test_cursor_pagination(self):
+        url = reverse('api_product_list')
+        response, data = self.get_json(url + '?limit=2')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        names = [row['product_name'] for row in data['results']]
+        while data['next']:
+            response, data = self.get_json(
+                url + '?limit=2&cursor=' + data['next'])
+            names += [row['product_name'] for row in data['results']]
+        self.assertEqual(names, ['Product %d' % i for i in range(5)])
+
+    def test_sparse_fieldsets(self):
+        response, data = self.get_json(
+            reverse('api_product_list') + '?fields=product_name,price')
+        self.assertEqual(data['results'][0],
+                         {'id': self.products[0].id,
+                          'product_name': 'Product 0', 'price': 10})
+
+    def test_embedded_data_does_not_scale_with_page_size(self):
+        url = reverse('api_product_list') + \
+            '?fields=average_rating,review_count,variations,gallery'
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            data = json.loads(b''.join(response.streaming_content))
+        # one page of products, its variations and gallery, then a check
+        # for a next page
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(data['results'][0]['average_rating'], 4.0)
+        self.assertEqual(data['results'][0]['review_count'], 1)
+        self.assertEqual(data['results'][0]['variations'],
+                         [{'category': 'color', 'value': 'red'}])
+
+    def test_etag_revalidation(self):
+        url = reverse('api_product_list')
+        response, data = self.get_json(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+        self.products[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip(self):
+        response, data = self.get_json(
+            reverse('api_product_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(data['results']), 5)
+
+    def test_invalid_parameters(self):
+        url = reverse('api_product_list')
+        self.assertEqual(
+            self.client.get(url + '?fields=password').status_code, 400)
+        self.assertEqual(
+            self.client.get(url + '?cursor=%%%').status_code, 400)
+        self.assertEqual(self.client.get(url + '?limit=x').status_code, 400)
+
+    def test_product_detail(self):
+        product = self.products[1]
+        response = self.client.get(
+            reverse('api_product_detail', args=[product.id]))
+        self.assertEqual(response.json()['slug'], 'product-1')
+        self.assertEqual(response.json()['category'], 'test-category')
+        response = self.client.get(reverse('api_product_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+        Product.objects.filter(pk=product.pk).update(is_available=False)
+        response = self.client.get(
+            reverse('api_product_detail', args=[product.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stock_is_not_exposed(self):
+        response, data = self.get_json(reverse('api_product_list'))
+        self.assertNotIn('stock', data['results'][0])
+        self.assertEqual(self.client.get(
+            reverse('api_product_list') + '?fields=stock').status_code, 400)
+
+    def test_category_list(self):
+        response, data = self.get_json(
+            reverse('api_category_list') + '?fields=slug')
+        self.assertEqual(data, {'results': [
+            {'id': self.category.id, 'slug': 'test-category'}],
+            'next': None})
+
+
+class CatalogImportExportTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def import_catalog(self, path, *args):
+        out = StringIO()
+        call_command('import_catalog', path, *args, stdout=out)
+        return out.getvalue()
+
+    def feed(self, price=10, variations='color:red|size:m'):
+        return self.write('feed.csv', (
+            'slug,product_name,price,stock,category_slug,category_name,'
+            'variations\n'
+            'shirt,Shirt,%d,5,tops,Tops,%s\n'
+            'hat,Hat,7,3,hats,Hats,\n') % (price, variations))
+
+    def test_import_creates_rows(self):
+        output = self.import_catalog(self.feed())
+        self.assertIn('2 created, 0 updated, 0 unchanged', output)
+        shirt = Product.objects.get(slug='shirt')
+        self.assertEqual(shirt.category.category_name, 'Tops')
+        self.assertEqual(
+            sorted(shirt.variation_set.values_list(
+                'variation_category', 'variation_value')),
+            [('color', 'red'), ('size', 'm')])
+
+    def test_unchanged_rows_are_skipped(self):
+        path = self.feed()
+        self.import_catalog(path)
+        with CaptureQueriesContext(connection) as queries:
+            output = self.import_catalog(path)
+        self.assertIn('0 created, 0 updated, 2 unchanged', output)
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith(('INSERT', 'UPDATE'))])
+
+    def test_changed_rows_are_updated(self):
+        self.import_catalog(self.feed())
+        shirt = Product.objects.get(slug='shirt')
+        output = self.import_catalog(self.feed(price=12, variations='color:red'))
+        self.assertIn('0 created, 1 updated, 1 unchanged', output)
+        shirt.refresh_from_db()
+        self.assertEqual(shirt.price, 12)
+        self.assertEqual(
+            list(shirt.variation_set.filter(is_active=True).values_list(
+                'variation_value', flat=True)), ['red'])
+        self.assertEqual(shirt.variation_set.count(), 2)
+
+    def test_hot_products_are_restocked_through_their_shards(self):
+        self.import_catalog(self.feed())
+        shirt = Product.objects.get(slug='shirt')
+        shirt.is_hot = True
+        shirt.save()
+        stock.set_stock(shirt.id, 5, shards=2)
+        stock.take(shirt.id, 1)
+        # A price change leaves the shards alone
+        self.import_catalog(self.feed(price=12))
+        self.assertEqual(stock.available(shirt), 4)
+        self.import_catalog(self.write('restock.csv', (
+            'slug,product_name,price,stock,category_slug,category_name,'
+            'variations\n'
+            'shirt,Shirt,12,9,tops,Tops,color:red|size:m\n')))
+        shirt.refresh_from_db()
+        self.assertEqual(shirt.stock, 9)
+        self.assertEqual(stock.available(shirt), 9)
+        self.assertEqual(shirt.stock_shards.count(), settings.STOCK_SHARDS)
+
+    def test_import_writes_stock_only_when_it_changes(self):
+        self.import_catalog(self.feed())
+        with CaptureQueriesContext(connection) as queries:
+            self.import_catalog(self.feed(price=12))
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "store_product"')]
+        self.assertTrue(updates)
+        self.assertFalse([sql for sql in updates if '"stock"' in sql])
+
+    def test_invalid_row(self):
+        path = self.write('bad.jsonl', '{"slug": "x", "price": 1}\n')
+        with self.assertRaisesMessage(CommandError, 'Row 1'):
+            self.import_catalog(path)
+
+    def test_export_round_trip(self):
+        self.import_catalog(self.feed())
+        for fmt in ('csv', 'jsonl'):
+            path = os.path.join(self.dir.name, 'export.' + fmt)
+            call_command('export_catalog', path, '--chunk-size', '1',
+                         stderr=StringIO())
+            output = self.import_catalog(path)
+            self.assertIn('0 created, 0 updated, 2 unchanged', output)
+
+    def test_dry_run_writes_nothing(self):
+        output = self.import_catalog(self.feed(), '--dry-run')
+        self.assertIn('Would import 2 rows', output)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Category.objects.exists())
+
+
+class RecommendationsTest(TestCase):
+    def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
+        cache.clear()
+        self.user = Account.objects.create_user(
+            first_name='John', last_name='Doe', username='johndoe',
+            email='johndoe@example.com', password='password')
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.products = [Product.objects.create(
+            product_name='Product %d' % i, slug='product-%d' % i, price=10,
+            stock=5, category=self.category,
+            images='photos/products/test.jpg') for i in range(4)]
+
+    def order(self, *indexes):
+        order = Order.objects.create(
+            user=self.user, order_number='N%d' % Order.objects.count(),
+            first_name='John', last_name='Doe', phone='1',
+            email='john@example.com',
+            address_line_1='1 Street', country='UA', state='Kyiv',
+            city='Kyiv', order_total=10, tax=1, is_ordered=True)
+        for i in indexes:
+            OrderProduct.objects.create(
+                order=order, user=self.user, product=self.products[i],
+                quantity=1, product_price=10, ordered=True)
+        # Lines from the last minute are left for the next run
+        OrderProduct.objects.filter(order=order).update(
+            created_at=timezone.now() - timedelta(minutes=5))
+
+    def build(self, *args):
+        out = StringIO()
+        call_command('build_recommendations', *args, stdout=out)
+        return out.getvalue()
+
+    def recommended(self, index):
+        return [(r.recommended.product_name, r.score) for r in
+                ProductRecommendation.objects.filter(
+                    product=self.products[index])]
+
+    def test_top_neighbours(self):
+        self.order(0, 1)
+        self.order(0, 1, 2)
+        self.order(0, 2)
+        self.order(0, 3)
+        self.order(1, 2)
+        self.build('--top', '2', '--chunk-size', '2')
+        self.assertEqual(self.recommended(0),
+                         [('Product 1', 2), ('Product 2', 2)])
+        self.assertEqual(self.recommended(3), [('Product 0', 1)])
+
+    def test_incremental_build_counts_each_order_once(self):
+        self.order(0, 1)
+        self.build()
+        self.build()
+        self.order(0, 1, 2)
+        output = self.build()
+        self.assertIn('Read 3 order lines', output)
+        self.assertEqual(self.recommended(1),
+                         [('Product 0', 2), ('Product 2', 1)])
+        self.build('--full')
+        self.assertEqual(self.recommended(1),
+                         [('Product 0', 2), ('Product 2', 1)])
+        self.assertEqual(CoPurchase.objects.count(), 6)
+
+    def test_product_page_lists_recommendations(self):
+        self.order(0, 1)
+        self.build()
+        response = self.client.get(self.products[0].get_url())
+        self.assertContains(response, 'Frequently bought together')
+        self.assertContains(response, 'Product 1')
+
+
+class StockShardTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=100,
+            stock=10, category=category, images='photos/products/test.jpg',
+            is_hot=True)
+        stock.set_stock(self.product.id, 10, shards=4)
+
+    def quantities(self):
+        return list(StockShard.objects.filter(
+            product=self.product).order_by('shard').values_list(
+            'quantity', flat=True))
+
+    def test_set_stock_spreads_evenly(self):
+        self.assertEqual(self.quantities(), [3, 3, 2, 2])
+        self.assertEqual(stock.available(self.product), 10)
+
+    def test_take_drains_shards_until_sold_out(self):
+        self.assertEqual(stock.take(self.product.id, 3), (True, False))
+        self.assertEqual(stock.available(self.product), 7)
+        # No single shard holds 5, so they are drained together
+        self.assertEqual(stock.take(self.product.id, 5), (True, False))
+        self.assertEqual(stock.take(self.product.id, 3), (False, False))
+        self.assertEqual(stock.take(self.product.id, 2), (True, True))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(stock.take(self.product.id, 1), (False, False))
+
+    def test_give_reports_back_in_stock(self):
+        stock.take(self.product.id, 10)
+        self.assertTrue(stock.give(self.product.id, 2))
+        self.assertFalse(stock.give(self.product.id, 1))
+        self.assertEqual(stock.available(self.product), 3)
+
+    def test_rebalance(self):
+        StockShard.objects.filter(product=self.product, shard=0).update(
+            quantity=0)
+        self.assertEqual(stock.rebalance(self.product.id), 7)
+        self.assertEqual(self.quantities(), [2, 2, 2, 1])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+
+    def test_unshard(self):
+        stock.take(self.product.id, 4)
+        self.assertEqual(stock.unshard(self.product.id), 6)
+        self.assertEqual(self.quantities(), [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+
+    def test_rebalance_command(self):
+        stock.take(self.product.id, 10)
+        Product.objects.filter(id=self.product.id).update(stock=10)
+        out = StringIO()
+        call_command('rebalance_stock_shards', stdout=out)
+        self.assertIn('Rebalanced 1 hot products', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_admin_flag_shards_and_unshards(self):
+        admin = Account.objects.create_superuser(
+            first_name='Admin', last_name='User', username='admin',
+            email='admin@example.com', password='password')
+        client = Client()
+        client.force_login(admin)
+        product = Product.objects.create(
+            product_name='Cold product', slug='cold-product', price=100,
+            stock=5, category=self.product.category,
+            images='photos/products/test.jpg')
+        url = reverse('admin:store_product_change', args=[product.id])
+        data = {
+            'product_name': 'Cold product', 'slug': 'cold-product',
+            'description': '', 'price': 100, 'stock': 5, 'initial-stock': 5,
+            'category': product.category_id, 'is_available': 'on',
+            'is_hot': 'on',
+            'productgallery_set-TOTAL_FORMS': 0,
+            'productgallery_set-INITIAL_FORMS': 0,
+        }
+        response = client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(StockShard.objects.filter(product=product).count(),
+                         settings.STOCK_SHARDS)
+        stock.take(product.id, 2)
+        del data['is_hot']
+        client.post(url, data)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 3)
+        self.assertFalse(StockShard.objects.filter(product=product).exists())
+
+    def test_admin_save_keeps_stock_sold_while_the_form_was_open(self):
+        admin = Account.objects.create_superuser(
+            first_name='Admin', last_name='User', username='admin',
+            email='admin@example.com', password='password')
+        client = Client()
+        client.force_login(admin)
+        product = Product.objects.create(
+            product_name='Cold product', slug='cold-product', price=100,
+            stock=5, category=self.product.category,
+            images='photos/products/test.jpg')
+        url = reverse('admin:store_product_change', args=[product.id])
+        data = {
+            'product_name': 'Cold product', 'slug': 'cold-product',
+            'description': '', 'price': 120, 'stock': 5, 'initial-stock': 5,
+            'category': product.category_id, 'is_available': 'on',
+            'productgallery_set-TOTAL_FORMS': 0,
+            'productgallery_set-INITIAL_FORMS': 0,
+        }
+        Product.objects.filter(id=product.id).update(stock=3, popularity=2)
+        self.assertEqual(client.post(url, data).status_code, 302)
+        product.refresh_from_db()
+        self.assertEqual((product.price, product.stock, product.popularity),
+                         (120, 3, 2))
+        # An edited stock is written
+        client.post(url, dict(data, stock=8))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 8)
+
+
+class StoreAdminListTest(TestCase):
+    def setUp(self):
+        self.admin = Account.objects.create_superuser(
+            first_name='Admin', last_name='User', username='admin',
+            email='admin@example.com', password='password')
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_products(self, count):
+        for i in range(Product.objects.count(), count):
+            product = Product.objects.create(
+                product_name=f'Shirt {i}', slug=f'shirt-{i}', price=10,
+                stock=1, category=self.category,
+                images='photos/products/test.jpg')
+            Variation.objects.create(
+                product=product, variation_category='color',
+                variation_value='red')
+            ReviewRating.objects.create(
+                product=product, user=self.admin, subject=f'Review {i}',
+                rating=4)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        urls = [reverse(f'admin:store_{model}_changelist')
+                for model in ('product', 'variation', 'reviewrating')]
+        self.add_products(2)
+        # Warm up the session and the cached category menu first
+        self.queries(urls[0])
+        few = [self.queries(url) for url in urls]
+        self.add_products(6)
+        self.queries(urls[0])
+        self.assertEqual([self.queries(url) for url in urls], few)
+
+    def test_product_filter_takes_an_id_or_a_name_prefix(self):
+        self.add_products(12)
+        product = Product.objects.get(product_name='Shirt 1')
+        url = reverse('admin:store_variation_changelist')
+        response = self.client.get(url)
+        # The sidebar does not list every product
+        self.assertNotContains(response, 'Shirt 11</a></li>')
+        response = self.client.get(url + '?product=%d' % product.id)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(url + '?product=shirt 1')
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+@override_settings(PRODUCT_VIEW_FLUSH_SECONDS=3600,
+                   PRODUCT_VIEW_FLUSH_SIZE=1000)
+class ProductPopularityTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        popularity.clear()
+        self.addCleanup(popularity.clear)
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.products = [Product.objects.create(
+            product_name=f'Product {i}', slug=f'product-{i}', price=10,
+            stock=5, category=self.category,
+            images='photos/products/test.jpg') for i in range(3)]
+
+    def view(self, product, times=1):
+        for i in range(times):
+            response = self.client.get(product.get_url())
+            self.assertEqual(response.status_code, 200)
+
+    def test_views_are_buffered_until_flushed(self):
+        self.view(self.products[1], 3)
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].popularity, 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(popularity.flush(now=popularity.EPOCH), 3)
+        self.assertEqual(len(queries), 2)
+        self.products[1].refresh_from_db()
+        # Cached hits count too; the score is log2(1 + 3)
+        self.assertAlmostEqual(self.products[1].popularity, 2)
+
+    def test_newer_views_weigh_more(self):
+        self.view(self.products[0], 2)
+        popularity.flush(now=popularity.EPOCH)
+        self.view(self.products[2])
+        week = settings.POPULARITY_HALF_LIFE_DAYS * 86400
+        popularity.flush(now=popularity.EPOCH + week)
+        self.products[0].refresh_from_db()
+        self.products[2].refresh_from_db()
+        # One view a half-life later weighs as much as two views before
+        self.assertAlmostEqual(self.products[0].popularity, math.log2(3))
+        self.assertAlmostEqual(self.products[2].popularity, math.log2(3))
+        self.assertEqual(
+            popularity.log_weight(popularity.EPOCH + 2 * week), 2)
+
+    @override_settings(POPULARITY_HALF_LIFE_DAYS=1)
+    def test_scores_stay_finite_far_from_epoch(self):
+        day = 86400
+        self.view(self.products[0], 2)
+        popularity.flush(now=popularity.EPOCH + 5000 * day)
+        self.view(self.products[1])
+        popularity.flush(now=popularity.EPOCH + 5001 * day)
+        self.view(self.products[0])
+        popularity.flush(now=popularity.EPOCH + 5001 * day)
+        for product in self.products:
+            product.refresh_from_db()
+        self.assertAlmostEqual(self.products[0].popularity, 5002)
+        self.assertAlmostEqual(self.products[1].popularity, 5001)
+        self.assertEqual(self.products[2].popularity, 0)
+
+    def test_failed_flush_keeps_the_views(self):
+        self.view(self.products[0], 2)
+        with patch.object(Product.objects, 'filter',
+                          side_effect=DatabaseError('locked')):
+            with self.assertRaises(DatabaseError):
+                popularity.flush()
+        self.assertEqual(popularity.flush(), 2)
+
+    @override_settings(PRODUCT_VIEW_FLUSH_SIZE=2)
+    def test_flushes_after_the_request_when_the_buffer_fills(self):
+        self.view(self.products[0])
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].popularity, 0)
+        self.view(self.products[0])
+        self.products[0].refresh_from_db()
+        self.assertGreater(self.products[0].popularity, 0)
+        self.assertFalse(popularity.is_due())
+
+    def test_store_and_home_sort_by_popularity(self):
+        Product.objects.filter(pk=self.products[2].pk).update(popularity=5)
+        Product.objects.filter(pk=self.products[1].pk).update(popularity=1)
+        response = self.client.get(reverse('store') + '?sort=popular')
+        self.assertEqual([product.slug for product in response.context[
+            'products']], ['product-2', 'product-1', 'product-0'])
+        self.assertContains(response, '<b>Popular</b>')
+        response = self.client.get(reverse('home'))
+        self.assertEqual([product.slug for product in response.context[
+            'products']], ['product-2', 'product-1', 'product-0'])
+
+    async def test_async_product_detail_counts_views(self):
+        request = AsyncRequestFactory().get(self.products[0].get_url())
+        request.session = SessionStore()
+        request.user = AnonymousUser()
+        await product_detail_async(request, 'test-category', 'product-0')
+        self.assertEqual(await sync_to_async(popularity.flush)(), 1)
+
+
+class WarmCachesCommandTest(TestCase):
+    def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
+        cache.clear()
+        self.category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product',
+            slug='test-product',
+            price=100,
+            stock=10,
+            category=self.category,
+            images='photos/products/test.jpg',
+        )
+
+    def test_warm_caches(self):
+        out = StringIO()
+        call_command('warm_caches', '--all-products', '--workers', '1',
+                     '--host', 'testserver',
+                     stdout=out)
+        self.assertIn('Warmed 4 pages, 0 failed, 0 skipped', out.getvalue())
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(self.product.get_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+    def test_warns_about_process_local_cache(self):
+        err = StringIO()
+        call_command('warm_caches', '--workers', '1', '--budget', '0',
+                     stdout=StringIO(), stderr=err)
+        self.assertIn('LocMemCache cache backend is local to this process',
+                      err.getvalue())
+
+    def test_warm_caches_budget(self):
+        out = StringIO()
+        call_command('warm_caches', '--workers', '1', '--budget', '0',
+                     stdout=out)
+        self.assertIn('Warmed 0 pages, 0 failed, 3 skipped', out.getvalue())
+
+
+class WarmCachesBaseUrlTest(LiveServerTestCase):
+    def setUp(self):
+        popularity.clear()
+        self.addCleanup(popularity.clear)
+        cache.clear()
+        category = Category.objects.create(
+            category_name='Test category', slug='test-category')
+        self.product = Product.objects.create(
+            product_name='Test product', slug='test-product', price=100,
+            stock=10, category=category, images='photos/products/test.jpg')
+
+    def test_requests_pages_from_the_server(self):
+        out, err = StringIO(), StringIO()
+        call_command('warm_caches', '--all-products', '--workers', '1',
+                     '--base-url', self.live_server_url,
+                     '/category/test-category/missing/',
+                     stdout=out, stderr=err)
+        self.assertIn('Warmed 4 pages, 1 failed, 0 skipped', out.getvalue())
+        self.assertEqual(err.getvalue(), '')
+        # The live server runs in this process, so its cache is visible
+        response = Client(HTTP_HOST=urlparse(self.live_server_url).netloc)
+        with CaptureQueriesContext(connection) as queries:
+            response = response.get(self.product.get_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
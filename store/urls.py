@@ -1,13 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    store, product_detail, search = (
+        views.store_async, views.product_detail_async, views.search_async)
+else:
+    store, product_detail, search = (
+        views.store, views.product_detail, views.search)
+
 urlpatterns = [
-    path("", views.store, name="store"),
+    path("", store, name="store"),
     path('category/<slug:category_slug>/',
-         views.store, name='products_by_category'),
+         store, name='products_by_category'),
     path('category/<slug:category_slug>/<slug:product_slug>/',
-         views.product_detail, name='product_detail'),
-    path('search/', views.search, name='search'),
+         product_detail, name='product_detail'),
+    path('search/', search, name='search'),
     path('submit_review/<int:product_id>',
          views.submit_review, name='submit_review'),
 ]
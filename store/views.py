@@ -1,4 +1,8 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404
 
 from carts.models import CartItem
 from .models import Product, ReviewRating, ProductGallery
@@ -10,10 +14,26 @@ from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from .forms import ReviewForm
 from django.contrib import messages
 from orders.models import OrderProduct
+from .cache import get_versions
+from .recommendations import for_product as recommendations_for
+from .popularity import count_product_views
+from bootique.page_cache import cache_anonymous_page
+
+SORTS = {
+    'popular': ('-popularity', 'id'),
+}
+
+
+def _sorted(request, products):
+    sort = request.GET.get('sort')
+    if sort not in SORTS:
+        return products.order_by('id'), ''
+    return products.order_by(*SORTS[sort]), sort
 
 # Create your views here.
 
 
+@cache_anonymous_page
 def store(request, category_slug=None):
     categories = None
     products = None
@@ -22,12 +42,14 @@ def store(request, category_slug=None):
         categories = get_object_or_404(Category, slug=category_slug)
         products = Product.objects.filter(
             category=categories, is_available=True)
+        products, sort = _sorted(request, products)
         paginator = Paginator(products, 6)
         page = request.GET.get('page')
         paged_products = paginator.get_page(page)
         product_count = products.count()
     else:
-        products = Product.objects.all().filter(is_available=True).order_by('id')
+        products = Product.objects.all().filter(is_available=True)
+        products, sort = _sorted(request, products)
         paginator = Paginator(products, 6)
         page = request.GET.get('page')
         paged_products = paginator.get_page(page)
@@ -36,13 +58,16 @@ def store(request, category_slug=None):
     context = {
         'products': paged_products,
         'product_count': product_count,
+        'sort': sort,
     }
     return render(request, 'store/store.html', context)
 
 
+@count_product_views
+@cache_anonymous_page
 def product_detail(request, category_slug, product_slug):
     try:
-        single_product = Product.objects.get(
+        single_product = Product.objects.with_rating().get(
             category__slug=category_slug, slug=product_slug)
         in_cart = CartItem.objects.filter(
             cart__cart_id=_cart_id(request), product=single_product).exists()
@@ -60,7 +85,7 @@ def product_detail(request, category_slug, product_slug):
 
     # Get the reviews
     reviews = ReviewRating.objects.filter(
-        product_id=single_product.id, status=True)
+        product_id=single_product.id, status=True).select_related('user')
 
     # Get the product gallery
     product_gallery = ProductGallery.objects.filter(
@@ -72,6 +97,10 @@ def product_detail(request, category_slug, product_slug):
         'orderproduct': orderproduct,
         'reviews': reviews,
         'product_gallery': product_gallery,
+        # reviews and product_gallery are lazy; they only hit the database
+        # when the cached fragments for these versions are missing
+        'versions': get_versions(single_product.id),
+        'recommendations': recommendations_for(single_product.id),
     }
 
     return render(request, 'store/product_detail.html', context)
@@ -117,3 +146,94 @@ def submit_review(request, product_id):
                     request, 'Thank you! Your review has been submitted.')
 
                 return redirect(url)
+
+
+# Async variants of the catalog views, routed instead of the sync ones when
+# ASYNC_VIEWS is on (the default under bootique.asgi). Independent queries
+# are awaited together with Django's async ORM; templates are rendered in a
+# worker thread because context processors and lazy querysets are sync.
+
+
+@cache_anonymous_page
+async def store_async(request, category_slug=None):
+    if category_slug is not None:
+        try:
+            categories = await Category.objects.aget(slug=category_slug)
+        except Category.DoesNotExist:
+            raise Http404
+        products = Product.objects.filter(
+            category=categories, is_available=True)
+    else:
+        products = Product.objects.all().filter(is_available=True)
+    products, sort = _sorted(request, products)
+
+    paginator = Paginator(products, 6)
+    paged_products = await sync_to_async(paginator.get_page)(
+        request.GET.get('page'))
+
+    context = {
+        'products': paged_products,
+        'product_count': paginator.count,
+        'sort': sort,
+    }
+    return await sync_to_async(render)(request, 'store/store.html', context)
+
+
+@count_product_views
+@cache_anonymous_page
+async def product_detail_async(request, category_slug, product_slug):
+    try:
+        single_product = await Product.objects.with_rating().aget(
+            category__slug=category_slug, slug=product_slug)
+    except Product.DoesNotExist:
+        raise Http404
+
+    cart_id, user = await sync_to_async(
+        lambda: (_cart_id(request), request.user))()
+
+    async def has_ordered():
+        if not user.is_authenticated:
+            return None
+        return await OrderProduct.objects.filter(
+            user=user, product_id=single_product.id).aexists()
+
+    in_cart, orderproduct, versions = await asyncio.gather(
+        CartItem.objects.filter(
+            cart__cart_id=cart_id, product=single_product).aexists(),
+        has_ordered(),
+        sync_to_async(get_versions)(single_product.id),
+    )
+
+    # Left lazy so the cached fragments can skip them
+    reviews = ReviewRating.objects.filter(
+        product_id=single_product.id, status=True).select_related('user')
+    product_gallery = ProductGallery.objects.filter(
+        product_id=single_product.id)
+
+    context = {
+        'single_product': single_product,
+        'in_cart': in_cart,
+        'orderproduct': orderproduct,
+        'reviews': reviews,
+        'product_gallery': product_gallery,
+        'versions': versions,
+        'recommendations': recommendations_for(single_product.id),
+    }
+    return await sync_to_async(render)(
+        request, 'store/product_detail.html', context)
+
+
+async def search_async(request):
+    products = Product.objects.none()
+    product_count = 0
+    keyword = request.GET.get('keyword')
+    if keyword:
+        products = Product.objects.order_by(
+            '-created_date').filter(Q(description__icontains=keyword) | Q(product_name__icontains=keyword))
+        products = [product async for product in products]
+        product_count = len(products)
+    context = {
+        'products': products,
+        'product_count': product_count,
+    }
+    return await sync_to_async(render)(request, 'store/store.html', context)